@@ -1,16 +1,269 @@
+import heapq
+import itertools
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import Future, InvalidStateError
+from dataclasses import dataclass, field
+
 import ollama
 
-def _request(model: str, message: str) -> str:
-    response = ollama.chat(model=f'{model}', messages=[
+import logging
+
+log: logging.Logger = logging.getLogger(__name__)
+
+QUICK_MODEL = 'llama3.2:1b'
+THINKING_MODEL = 'deepseek-coder:6.7b'
+# Сколько ждать очередной кусок ответа; срок запроса целиком отслеживает InferenceQueue
+READ_TIMEOUT = 15
+
+
+def _request(model: str, message: str, client: ollama.Client | None = None, deadline: float | None = None) -> str:
+    client = client or ollama
+    messages = [
         {
             'role': 'user',
             'content': f'{message}'
         },
-    ])
-    return response['message']['content']
+    ]
+    if deadline is None:
+        response = client.chat(model=f'{model}', messages=messages)
+        return response['message']['content']
+
+    # Ответ читаем потоком, чтобы прервать генерацию, как только истек срок
+    parts = []
+    stream = client.chat(model=f'{model}', messages=messages, stream=True)
+    try:
+        for chunk in stream:
+            parts.append(chunk['message']['content'])
+            if time.monotonic() >= deadline:
+                raise DeadlineExceeded(f"model {model} did not answer in time")
+    finally:
+        stream.close()
+    return ''.join(parts)
 
 def quik_request(message: str) -> str:
-    return _request('llama3.2:1b', message)
+    return _request(QUICK_MODEL, message)
 
 def thinking_request(message: str) -> str:
-    return _request('deepseek-coder:6.7b', message)
+    return _request(THINKING_MODEL, message)
+
+
+class QueueFull(Exception):
+    pass
+
+
+class QuotaExceeded(Exception):
+    def __init__(self, message: str, retry_in: float = 0):
+        super().__init__(message)
+        self.retry_in = retry_in
+
+
+class DeadlineExceeded(TimeoutError):
+    pass
+
+
+@dataclass
+class InferenceRequest:
+    user_id: int
+    model: str
+    prompt: str
+    deadline: float
+    future: Future = field(default_factory=Future)
+
+
+class InferenceQueue:
+    def __init__(self, workers: int = 1, queue_size: int = 50, max_pending_per_user: int = 2,
+                 per_user_per_hour: int = 30, deadline: float = 120, model: str = THINKING_MODEL,
+                 host: str | None = None):
+        self.workers = workers
+        self.queue_size = queue_size
+        self.max_pending_per_user = max_pending_per_user
+        self.per_user_per_hour = per_user_per_hour
+        self.deadline = deadline
+        self.model = model
+        self.host = host
+
+        lock = threading.Lock()
+        self._cond = threading.Condition(lock)
+        # Сроки запросов: отдельное ожидание на том же замке, чтобы не будить воркеры
+        self._deadline_cond = threading.Condition(lock)
+        self._deadlines: list[tuple[float, int, InferenceRequest]] = []
+        self._seq = itertools.count()
+        # Очереди пользователей обходятся по кругу: один запрос от каждого за проход
+        self._users: OrderedDict[int, deque[InferenceRequest]] = OrderedDict()
+        self._history: dict[int, deque[float]] = {}
+        self._size = 0
+        self._running = 0
+        self._running_users: dict[int, int] = {}
+        self._stopped = False
+        self._threads = [threading.Thread(target=self._work, name=f"ai-worker-{i}", daemon=True)
+                         for i in range(workers)]
+        self._threads.append(threading.Thread(target=self._watch, name="ai-deadlines", daemon=True))
+
+        self.completed = 0
+        self.expired = 0
+        self.failed = 0
+
+    def start(self) -> "InferenceQueue":
+        for thread in self._threads:
+            thread.start()
+        log.info(f"Inference queue started, workers: {self.workers}")
+        return self
+
+    def _check_quota(self, user_id: int, now: float) -> None:
+        pending = len(self._users.get(user_id, ())) + self._running_users.get(user_id, 0)
+        if pending >= self.max_pending_per_user:
+            raise QuotaExceeded(f"user {user_id} already has {pending} unanswered requests")
+        history = self._history.setdefault(user_id, deque())
+        while history and history[0] <= now - 3600:
+            history.popleft()
+        if len(history) >= self.per_user_per_hour:
+            raise QuotaExceeded(f"user {user_id} exceeded {self.per_user_per_hour} requests per hour",
+                                retry_in=history[0] + 3600 - now)
+
+    def _position(self, user_id: int) -> int:
+        # Сколько запросов будет обработано раньше при обходе по кругу; 0 - свободный воркер возьмет сразу
+        own = len(self._users.get(user_id, ()))
+        ahead = own
+        for other, queue in self._users.items():
+            if other != user_id:
+                ahead += min(len(queue), own + 1)
+        return max(0, ahead + self._running - self.workers + 1)
+
+    def submit(self, user_id: int, prompt: str, model: str | None = None) -> tuple[Future, int]:
+        now = time.monotonic()
+        with self._cond:
+            if self._stopped:
+                raise QueueFull("inference queue is stopped")
+            if self._size >= self.queue_size:
+                raise QueueFull(f"inference queue is full ({self.queue_size} requests)")
+            self._check_quota(user_id, now)
+
+            position = self._position(user_id)
+            request = InferenceRequest(user_id, model or self.model, prompt, now + self.deadline)
+            self._users.setdefault(user_id, deque()).append(request)
+            self._history[user_id].append(now)
+            self._size += 1
+            heapq.heappush(self._deadlines, (request.deadline, next(self._seq), request))
+            self._cond.notify()
+            self._deadline_cond.notify()
+        return request.future, position
+
+    def _next(self) -> InferenceRequest | None:
+        with self._cond:
+            while not self._stopped:
+                while self._users:
+                    user_id, queue = next(iter(self._users.items()))
+                    request = queue.popleft()
+                    self._size -= 1
+                    if queue:
+                        self._users.move_to_end(user_id)
+                    else:
+                        del self._users[user_id]
+                    if not request.future.set_running_or_notify_cancel():
+                        continue
+                    self._running += 1
+                    self._running_users[request.user_id] = self._running_users.get(request.user_id, 0) + 1
+                    return request
+                self._cond.wait()
+            return None
+
+    def _watch(self) -> None:
+        # Срок запроса истекает независимо от воркера: ответ пользователю не ждет зависшую модель
+        while True:
+            expired = []
+            with self._cond:
+                while not self._stopped:
+                    now = time.monotonic()
+                    while self._deadlines and (self._deadlines[0][0] <= now or self._deadlines[0][2].future.done()):
+                        _, _, request = heapq.heappop(self._deadlines)
+                        if not request.future.done():
+                            self._drop_queued(request)
+                            expired.append(request)
+                    if expired:
+                        break
+                    timeout = self._deadlines[0][0] - now if self._deadlines else None
+                    self._deadline_cond.wait(timeout)
+                if self._stopped and not expired:
+                    return
+            for request in expired:
+                try:
+                    request.future.set_exception(DeadlineExceeded(f"model {request.model} did not answer in time"))
+                except InvalidStateError:
+                    continue
+                self.expired += 1
+
+    def _drop_queued(self, request: InferenceRequest) -> None:
+        queue = self._users.get(request.user_id)
+        if queue is None or request not in queue:
+            return
+        queue.remove(request)
+        self._size -= 1
+        if not queue:
+            del self._users[request.user_id]
+
+    def _work(self) -> None:
+        # Один клиент (и пул соединений) на поток воркера
+        with ollama.Client(host=self.host, timeout=READ_TIMEOUT) as client:
+            while True:
+                request = self._next()
+                if request is None:
+                    return
+                self._process(client, request)
+
+    def _process(self, client: ollama.Client, request: InferenceRequest) -> None:
+        started = time.monotonic()
+        try:
+            answer = _request(request.model, request.prompt, client, request.deadline)
+        except Exception as e:
+            if not isinstance(e, DeadlineExceeded) and time.monotonic() < request.deadline:
+                self.failed += 1
+                self._resolve(request, error=e)
+        else:
+            if self._resolve(request, answer):
+                self.completed += 1
+                log.info(f"Inference for user {request.user_id} took {time.monotonic() - started:.1f} s")
+        finally:
+            with self._cond:
+                self._running -= 1
+                left = self._running_users.pop(request.user_id) - 1
+                if left:
+                    self._running_users[request.user_id] = left
+
+    @staticmethod
+    def _resolve(request: InferenceRequest, answer: str | None = None, error: Exception | None = None) -> bool:
+        try:
+            if error is None:
+                request.future.set_result(answer)
+            else:
+                request.future.set_exception(error)
+            return True
+        except InvalidStateError:
+            # Срок уже истек и пользователь получил ответ о таймауте
+            log.info(f"Dropped late answer for user {request.user_id}")
+            return False
+
+    def stats(self) -> dict:
+        with self._cond:
+            return {
+                'queued': self._size,
+                'running': self._running,
+                'users': len(self._users),
+                'completed': self.completed,
+                'expired': self.expired,
+                'failed': self.failed,
+            }
+
+    def stop(self) -> None:
+        with self._cond:
+            self._stopped = True
+            for queue in self._users.values():
+                for request in queue:
+                    request.future.cancel()
+            self._users.clear()
+            self._size = 0
+            self._deadlines.clear()
+            self._cond.notify_all()
+            self._deadline_cond.notify_all()
+        log.info(f"Inference queue stopped: {self.stats()}")
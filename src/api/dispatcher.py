@@ -0,0 +1,108 @@
+import asyncio
+from collections import deque
+from typing import Awaitable, Callable, Hashable
+
+import logging
+
+log: logging.Logger = logging.getLogger(__name__)
+
+
+def chat_key(update) -> Hashable:
+    # Апдейты одного чата обрабатываются строго по порядку
+    for name in ('message', 'edited_message', 'callback_query', 'channel_post', 'edited_channel_post'):
+        event = getattr(update, name, None)
+        if event is None:
+            continue
+        message = getattr(event, 'message', event)
+        chat = getattr(message, 'chat', None)
+        if chat is not None:
+            return chat.id
+        user = getattr(event, 'from_user', None)
+        if user is not None:
+            return user.id
+    return ('update', update.update_id)
+
+
+class ChatDispatcher:
+    def __init__(self, handler: Callable[[object], Awaitable], concurrency: int = 8, queue_size: int = 256,
+                 key: Callable[[object], Hashable] = chat_key):
+        self.handler = handler
+        self.key = key
+        self.queue_size = queue_size
+        self._running = asyncio.Semaphore(concurrency)
+        self._size = 0
+        self._space = asyncio.Event()
+        self._queues: dict[Hashable, deque] = {}
+        self._tasks: set[asyncio.Task] = set()
+        self._closed = False
+        self.handled = 0
+        self.failed = 0
+
+    async def submit(self, update) -> None:
+        # Когда очередь заполнена, ждем здесь - это притормаживает получение апдейтов
+        while self._size >= self.queue_size and not self._closed:
+            self._space.clear()
+            await self._space.wait()
+        self._enqueue(update)
+
+    def offer(self, update) -> bool:
+        if self._closed or self._size >= self.queue_size:
+            return False
+        self._enqueue(update)
+        return True
+
+    def _enqueue(self, update) -> None:
+        if self._closed:
+            raise RuntimeError("dispatcher is closed")
+        self._size += 1
+        key = self.key(update)
+        queue = self._queues.get(key)
+        if queue is not None:
+            queue.append(update)
+            return
+        self._queues[key] = deque([update])
+        task = asyncio.create_task(self._drain(key), name=f"chat-{key}")
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _drain(self, key: Hashable) -> None:
+        queue = self._queues[key]
+        try:
+            while queue:
+                update = queue[0]
+                try:
+                    async with self._running:
+                        await self.handler(update)
+                    self.handled += 1
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    self.failed += 1
+                    log.error(f"Error handling update {update.update_id}: {e}", exc_info=True)
+                finally:
+                    queue.popleft()
+                    self._release(1)
+        finally:
+            # Отмененные апдейты тоже освобождают место в очереди
+            self._release(len(queue))
+            self._queues.pop(key, None)
+
+    def _release(self, count: int) -> None:
+        self._size -= count
+        self._space.set()
+
+    @property
+    def pending(self) -> int:
+        return self._size
+
+    async def close(self, timeout: float) -> None:
+        self._closed = True
+        self._space.set()
+        if self._tasks:
+            done, running = await asyncio.wait(set(self._tasks), timeout=timeout)
+            for task in running:
+                task.cancel()
+            if running:
+                log.warning(f"Cancelled {len(running)} chats with unfinished updates")
+                await asyncio.gather(*running, return_exceptions=True)
+        log.info(f"Dispatcher closed, handled: {self.handled}, failed: {self.failed}")
@@ -0,0 +1,311 @@
+import heapq
+import itertools
+import threading
+import time
+from concurrent.futures import Future, InvalidStateError, ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Callable
+
+from telebot.apihelper import ApiTelegramException
+
+import logging
+
+from src.api.resilience import backoff_delay
+
+log: logging.Logger = logging.getLogger(__name__)
+
+INTERACTIVE = 0
+BULK = 1
+PRIORITY_NAMES = {INTERACTIVE: 'interactive', BULK: 'bulk'}
+
+
+class TokenBucket:
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay(self, now: float) -> float:
+        self._refill(now)
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def take(self, now: float) -> None:
+        self._refill(now)
+        self.tokens -= 1
+
+    def full(self, now: float) -> bool:
+        self._refill(now)
+        return self.tokens >= self.capacity
+
+
+@dataclass(order=True)
+class Job:
+    priority: int
+    seq: int
+    chat_id: int = field(compare=False)
+    fn: Callable = field(compare=False)
+    args: tuple = field(compare=False)
+    kwargs: dict = field(compare=False)
+    future: Future = field(compare=False)
+    enqueued: float = field(compare=False)
+    attempts: int = field(default=0, compare=False)
+
+
+def retry_after(e: ApiTelegramException) -> float | None:
+    if e.error_code != 429:
+        return None
+    parameters = (e.result_json or {}).get('parameters') or {}
+    return float(parameters.get('retry_after', 1))
+
+
+class Outbox:
+    def __init__(self, global_rate: float = 30, chat_rate: float = 1, chat_burst: float = 3,
+                 group_per_minute: float = 20, workers: int = 8, max_attempts: int = 5):
+        # Всплеск вычитаем из скорости пополнения: за любую секунду уходит не больше global_rate
+        burst = max(1.0, global_rate / 10)
+        self.global_bucket = TokenBucket(max(global_rate - burst, global_rate / 2), burst)
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.group_rate = group_per_minute / 60
+        self.max_attempts = max_attempts
+
+        self._cond = threading.Condition()
+        self._seq = itertools.count()
+        # Очередь каждого чата отдельно: порядок внутри чата, приоритет между чатами
+        self._chats: dict[int, list[Job]] = {}
+        self._buckets: dict[int, TokenBucket] = {}
+        self._ready: list[tuple[int, int, int]] = []
+        self._waiting: list[tuple[float, int, int]] = []
+        self._busy: set[int] = set()
+        self._active: dict[int, Job] = {}
+        self._blocked: dict[int, float] = {}
+        self._global_blocked = 0.0
+        self._stopped = False
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="tg-outbox")
+        self._thread = threading.Thread(target=self._run, name="tg-outbox-scheduler", daemon=True)
+
+        self._stats_lock = threading.Lock()
+        self.sent = {INTERACTIVE: 0, BULK: 0}
+        self.latency = {INTERACTIVE: 0.0, BULK: 0.0}
+        self.throttled = 0
+        self.retried = 0
+        self.failed = 0
+
+    def start(self) -> "Outbox":
+        self._thread.start()
+        return self
+
+    def submit(self, chat_id: int, fn: Callable, *args, priority: int = INTERACTIVE, **kwargs) -> Future:
+        future = Future()
+        job = Job(priority, next(self._seq), chat_id, fn, args, kwargs, future, time.monotonic())
+        with self._cond:
+            if self._stopped:
+                raise RuntimeError("outbox is stopped")
+            queue = self._chats.setdefault(chat_id, [])
+            heapq.heappush(queue, job)
+            # Перепланируем чат, если задача встала в голову его очереди
+            if chat_id not in self._busy and queue[0] is job:
+                self._schedule(chat_id, time.monotonic())
+            self._cond.notify()
+        return future
+
+    def _bucket(self, chat_id: int) -> TokenBucket:
+        bucket = self._buckets.get(chat_id)
+        if bucket is None:
+            # Отрицательные id - группы и каналы, у них свой лимит
+            if chat_id < 0:
+                bucket = TokenBucket(self.group_rate, 1)
+            else:
+                bucket = TokenBucket(self.chat_rate, self.chat_burst)
+            self._buckets[chat_id] = bucket
+        return bucket
+
+    def _schedule(self, chat_id: int, now: float) -> None:
+        queue = self._chats.get(chat_id)
+        if not queue:
+            self._chats.pop(chat_id, None)
+            bucket = self._buckets.get(chat_id)
+            if bucket is not None and bucket.full(now) and chat_id not in self._blocked:
+                del self._buckets[chat_id]
+            return
+        ready_at = max(now + self._bucket(chat_id).delay(now), self._blocked.get(chat_id, 0.0))
+        if ready_at <= now:
+            heapq.heappush(self._ready, (queue[0].priority, queue[0].seq, chat_id))
+        else:
+            heapq.heappush(self._waiting, (ready_at, queue[0].seq, chat_id))
+
+    def _next_job(self) -> tuple[Job | None, float | None]:
+        now = time.monotonic()
+        while self._waiting and self._waiting[0][0] <= now:
+            _, _, chat_id = heapq.heappop(self._waiting)
+            if chat_id not in self._busy:
+                self._schedule(chat_id, now)
+
+        wait = self._waiting[0][0] - now if self._waiting else None
+        while self._ready:
+            # Пауза после флуд-лимита рассылки не задерживает ответы пользователям
+            paused_until = self._global_blocked if self._ready[0][0] == BULK else 0.0
+            global_delay = max(self.global_bucket.delay(now), paused_until - now)
+            if global_delay > 0:
+                return None, global_delay if wait is None else min(wait, global_delay)
+
+            _, _, chat_id = heapq.heappop(self._ready)
+            if chat_id in self._busy or not self._chats.get(chat_id):
+                continue
+            bucket = self._bucket(chat_id)
+            if bucket.delay(now) > 0 or self._blocked.get(chat_id, 0.0) > now:
+                self._schedule(chat_id, now)
+                return None, 0
+            bucket.take(now)
+            self.global_bucket.take(now)
+            self._blocked.pop(chat_id, None)
+            self._busy.add(chat_id)
+            job = heapq.heappop(self._chats[chat_id])
+            self._active[job.seq] = job
+            return job, None
+        return None, wait
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                if self._stopped:
+                    return
+                job, wait = self._next_job()
+                if job is None:
+                    if wait != 0:
+                        self._cond.wait(wait)
+                    continue
+            self._executor.submit(self._deliver, job)
+
+    def _deliver(self, job: Job) -> None:
+        job.attempts += 1
+        delay = None
+        try:
+            for value in (*job.args, *job.kwargs.values()):
+                if hasattr(value, 'seek'):
+                    value.seek(0)
+            result = job.fn(*job.args, **job.kwargs)
+        except ApiTelegramException as e:
+            delay = retry_after(e)
+            if delay is not None:
+                with self._stats_lock:
+                    self.throttled += 1
+                log.warning(f"Flood limit for chat {job.chat_id}, retry after {delay} s")
+            elif e.error_code >= 500:
+                delay = backoff_delay(job.attempts, 1, 30)
+            if delay is None or job.attempts >= self.max_attempts:
+                self._finish(job, error=e)
+            else:
+                self._retry(job, delay, flood=e.error_code == 429)
+            return
+        except Exception as e:
+            if job.attempts >= self.max_attempts:
+                self._finish(job, error=e)
+            else:
+                self._retry(job, backoff_delay(job.attempts, 1, 30))
+            return
+        self._finish(job, result=result)
+
+    def _retry(self, job: Job, delay: float, flood: bool = False) -> None:
+        with self._stats_lock:
+            self.retried += 1
+        now = time.monotonic()
+        with self._cond:
+            self._active.pop(job.seq, None)
+            self._blocked[job.chat_id] = now + delay
+            if flood and job.priority == BULK:
+                # Массовая рассылка уперлась в общий лимит - притормаживаем ее целиком
+                self._global_blocked = max(self._global_blocked, now + delay)
+            heapq.heappush(self._chats.setdefault(job.chat_id, []), job)
+            self._busy.discard(job.chat_id)
+            self._schedule(job.chat_id, now)
+            self._cond.notify()
+
+    def _finish(self, job: Job, result=None, error: Exception | None = None) -> None:
+        with self._stats_lock:
+            if error is None:
+                self.sent[job.priority] += 1
+                self.latency[job.priority] += time.monotonic() - job.enqueued
+            else:
+                self.failed += 1
+        try:
+            if error is None:
+                job.future.set_result(result)
+            else:
+                log.error(f"Error sending to chat {job.chat_id} after {job.attempts} attempts: {error}")
+                job.future.set_exception(error)
+        except InvalidStateError:
+            # Задачу уже завершил stop()
+            pass
+
+        with self._cond:
+            self._active.pop(job.seq, None)
+            self._busy.discard(job.chat_id)
+            self._schedule(job.chat_id, time.monotonic())
+            self._cond.notify()
+
+    def stats(self) -> dict:
+        with self._cond:
+            queued = sum(len(queue) for queue in self._chats.values())
+        with self._stats_lock:
+            return {
+                'queued': queued,
+                'throttled': self.throttled,
+                'retried': self.retried,
+                'failed': self.failed,
+                **{f"sent_{PRIORITY_NAMES[p]}": count for p, count in self.sent.items()},
+                **{f"latency_{PRIORITY_NAMES[p]}_ms": self.latency[p] / count * 1000
+                   for p, count in self.sent.items() if count},
+            }
+
+    def stop(self, timeout: float = 10) -> None:
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            while any(self._chats.values()) or self._busy:
+                left = deadline - time.monotonic()
+                if left <= 0:
+                    break
+                self._cond.wait(min(left, 0.1))
+            self._stopped = True
+            pending = [job for queue in self._chats.values() for job in queue] + list(self._active.values())
+            self._chats.clear()
+            self._active.clear()
+            self._cond.notify()
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        # Неотправленные задачи завершаем ошибкой, иначе ожидающие их хендлеры зависнут
+        for job in pending:
+            try:
+                job.future.set_exception(RuntimeError("outbox is stopped"))
+            except InvalidStateError:
+                pass
+        if pending:
+            log.warning(f"Dropped {len(pending)} unsent messages")
+        log.info(f"Outbox stopped: {self.stats()}")
+
+
+class Sender:
+    # Обертка с интерфейсом TeleBot: вызовы идут через очередь и ждут отправки
+    def __init__(self, bot, outbox: Outbox, priority: int = INTERACTIVE, timeout: float = 120):
+        self.bot = bot
+        self.outbox = outbox
+        self.priority = priority
+        self.timeout = timeout
+
+    def _call(self, chat_id: int, fn: Callable, *args, **kwargs):
+        return self.outbox.submit(chat_id, fn, *args, priority=self.priority, **kwargs).result(self.timeout)
+
+    def send_message(self, chat_id: int, text: str, **kwargs):
+        return self._call(chat_id, self.bot.send_message, chat_id, text, **kwargs)
+
+    def send_photo(self, chat_id: int, photo, **kwargs):
+        return self._call(chat_id, self.bot.send_photo, chat_id, photo, **kwargs)
+
+    def reply_to(self, message, text: str, **kwargs):
+        return self._call(message.chat.id, self.bot.reply_to, message, text, **kwargs)
@@ -0,0 +1,139 @@
+import asyncio
+import random
+import threading
+import time
+from typing import Awaitable, Callable, TypeVar
+
+import aiohttp
+
+import logging
+
+log: logging.Logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+PROBE_POLL = 0.05
+
+
+class CircuitOpen(Exception):
+    def __init__(self, name: str, retry_in: float):
+        super().__init__(f"circuit {name} is open, retry in {retry_in:.0f} s")
+        self.retry_in = retry_in
+
+
+class DeadlineExceeded(asyncio.TimeoutError):
+    pass
+
+
+class CircuitBreaker:
+    def __init__(self, name: str, failure_threshold: int = 5, reset_timeout: float = 60):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._lock = threading.Lock()
+        self._state = CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probe = False
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self._state == OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+                return HALF_OPEN
+            return self._state
+
+    @property
+    def is_open(self) -> bool:
+        return self.state == OPEN
+
+    @property
+    def probing(self) -> bool:
+        with self._lock:
+            return self._probe
+
+    def allow(self) -> None:
+        with self._lock:
+            if self._state == CLOSED:
+                return
+            retry_in = self.reset_timeout - (time.monotonic() - self._opened_at)
+            # После таймаута пропускаем один пробный запрос; остальные получают CircuitOpen,
+            # а call() ждет результата пробы, пока позволяет дедлайн
+            if retry_in > 0 or self._probe:
+                raise CircuitOpen(self.name, max(retry_in, 0))
+            self._state = HALF_OPEN
+            self._probe = True
+
+    def record_success(self) -> None:
+        with self._lock:
+            if self._state != CLOSED:
+                log.info(f"Circuit {self.name} closed")
+            self._state = CLOSED
+            self._failures = 0
+            self._probe = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._failures += 1
+            self._probe = False
+            if self._state == HALF_OPEN or self._failures >= self.failure_threshold:
+                if self._state != OPEN:
+                    log.warning(f"Circuit {self.name} opened after {self._failures} failures")
+                self._state = OPEN
+                self._opened_at = time.monotonic()
+
+
+def backoff_delay(attempt: int, base: float, cap: float) -> float:
+    # full jitter: случайная пауза от нуля до экспоненциального предела
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+
+def is_retryable(e: BaseException) -> bool:
+    status = getattr(e, "status", None)
+    if status is not None:
+        return status == 429 or status >= 500
+    return isinstance(e, (aiohttp.ClientError, asyncio.TimeoutError, ConnectionError))
+
+
+async def _admit(breaker: CircuitBreaker, expires: float) -> None:
+    while True:
+        try:
+            breaker.allow()
+            return
+        except CircuitOpen:
+            # Пока идет пробный запрос, ждем его: при успехе цепь закроется и запрос пройдет
+            if not breaker.probing or time.monotonic() + PROBE_POLL >= expires:
+                raise
+            await asyncio.sleep(PROBE_POLL)
+
+
+async def call(fn: Callable[[], Awaitable[T]], breaker: CircuitBreaker, attempts: int,
+               base_delay: float, max_delay: float, deadline: float) -> T:
+    expires = time.monotonic() + deadline
+    attempt = 0
+    while True:
+        await _admit(breaker, expires)
+        remaining = expires - time.monotonic()
+        if remaining <= 0:
+            raise DeadlineExceeded(f"deadline {deadline} s exceeded")
+        try:
+            result = await asyncio.wait_for(fn(), remaining)
+        except Exception as e:
+            if not is_retryable(e):
+                # Сервер ответил, значит он доступен
+                breaker.record_success()
+                raise
+            breaker.record_failure()
+            attempt += 1
+            delay = backoff_delay(attempt, base_delay, max_delay)
+            if attempt >= attempts or breaker.is_open or time.monotonic() + delay >= expires:
+                raise
+            log.info(f"Retry {attempt}/{attempts - 1} in {delay:.2f} s after {type(e).__name__}: {e}")
+            await asyncio.sleep(delay)
+            continue
+        breaker.record_success()
+        return result
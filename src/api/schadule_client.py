@@ -1,15 +1,92 @@
-import http.client
+import asyncio
+import codecs
+import hashlib
 import json
-import gzip
+import sys
+import threading
+import zlib
+from dataclasses import dataclass
 from datetime import datetime
-from typing import List
+from typing import Callable, Iterable, Iterator, List
 import logging
 
+import aiohttp
 import arrow
 
+from src.api import resilience
+
 log = logging.getLogger(__name__)
 
+GROUP_ID = 43
+API_HOST = "api.platform.nke.team:8443"
+
+
+def _zstd_decompressor():
+    try:
+        from compression import zstd
+        return lambda: zstd.ZstdDecompressor().decompress
+    except ImportError:
+        pass
+    try:
+        import zstandard
+        return lambda: zstandard.ZstdDecompressor().decompressobj().decompress
+    except ImportError:
+        return None
+
+
+def _brotli_decompressor():
+    try:
+        import brotli
+        return lambda: brotli.Decompressor().process
+    except ImportError:
+        return None
+
+
+class _Inflate:
+    # deflate бывает как с zlib-заголовком, так и "сырым"; решаем по первым двум байтам
+    def __init__(self):
+        self._obj = None
+        self._head = b""
+
+    def __call__(self, data: bytes) -> bytes:
+        if self._obj is None:
+            self._head += data
+            if len(self._head) < 2:
+                return b""
+            cmf, flg = self._head[0], self._head[1]
+            zlib_header = cmf & 0x0F == 8 and (cmf << 8 | flg) % 31 == 0
+            self._obj = zlib.decompressobj(zlib.MAX_WBITS if zlib_header else -zlib.MAX_WBITS)
+            data, self._head = self._head, b""
+        return self._obj.decompress(data)
+
+
+# Фабрики потоковых декодеров: каждая возвращает функцию chunk -> bytes
+DECODERS = {
+    'gzip': lambda: zlib.decompressobj(16 + zlib.MAX_WBITS).decompress,
+    'x-gzip': lambda: zlib.decompressobj(16 + zlib.MAX_WBITS).decompress,
+    'deflate': _Inflate,
+    'identity': lambda: bytes,
+}
+if _brotli_decompressor() is not None:
+    DECODERS['br'] = _brotli_decompressor()
+if _zstd_decompressor() is not None:
+    DECODERS['zstd'] = _zstd_decompressor()
+
+ACCEPT_ENCODING = ", ".join(name for name in ('gzip', 'deflate', 'br', 'zstd') if name in DECODERS)
+
+CHUNK_SIZE = 64 * 1024
+
+
+class ScheduleApiError(Exception):
+    def __init__(self, status: int, message: str = ""):
+        super().__init__(f"schedule api returned {status} {message}".strip())
+        self.status = status
+
+
 class Lesson:
+    __slots__ = ('date', 'sort', 'classroom_id', 'subgroup', 'start', 'end', 'teacher_full',
+                 'teacher_birthday', 'classroom_title', 'subject_title', 'short_subject_title')
+
     def __init__(self, date: str, sort: int, classroom_id: int, subgroup: int, start: int, end: int,
                  teacher_full: str, teacher_birthday: int, classroom_title: str, subject_title: str, short_subject_title: str):
         self.date = date
@@ -28,62 +105,351 @@ class Lesson:
         return f"Lesson(date={self.date}, sort={self.sort}, subject={self.subject_title})"
 
 
-def parse_schedule(data: int) -> List[Lesson]:
-    log.warning("Created pars data")
-    start: int =    int(arrow.get(data).floor('week').timestamp())
-    end: int =   int(arrow.get(data).floor('week').shift(days=6).timestamp())
-    conn = http.client.HTTPSConnection("api.platform.nke.team:8443")
-
-    payload = ""
-
-    headers = {
-        'Accept': "application/json, text/plain, */*",
-        'Accept-Encoding': "gzip, deflate, br, zstd",
-        'Accept-Language': "ru-RU,ru;q=0.9,en-US;q=0.8,en;q=0.7",
-        'Authorization': "Bearer nke",
-        'Cache-Control': "no-cache",
-        'Connection': "keep-alive",
-        'DNT': "1",
-        'Origin': "http://www.nke.ru",
-        'Pragma': "no-cache",
-        'Priority': "u=0",
-        'Referer': "http://www.nke.ru/",
-        'Sec-Fetch-Dest': "empty",
-        'Sec-Fetch-Mode': "cors",
-        'Sec-Fetch-Site': "cross-site",
-        'Sec-GPC': "1",
-        'TE': "trailers",
-        'User-Agent': "Mozilla/5.0 (X11; Linux x86_64; rv:147.0) Gecko/20100101 Firefox/147.0"
-    }
-
-    conn.request("GET", f"/schedule?start={start}&end={end}&groupId=43", payload, headers)
-
-    res = conn.getresponse()
-    data = res.read()
-
-    content_encoding = res.headers.get('Content-Encoding', '')
-    if 'gzip' in content_encoding:
-        data = gzip.decompress(data)
-
-    json_data = json.loads(data.decode("utf-8"))
-
-    lessons = []
-    for item in json_data["items"]:
-        date_str = datetime.fromtimestamp(item["date"]).strftime('%Y-%m-%d')
-        lesson = Lesson(
-            date=date_str,
-            sort=item["sort"],
-            classroom_id=item["classroomId"],
-            subgroup=item["subgroup"],
-            start=item["start"],
-            end=item["end"],
-            teacher_full=item["teacher"]["full"],
-            teacher_birthday=item["teacher"]["birthDate"],
-            classroom_title=item["classroom"]["title"],
-            subject_title=item["plan"]["subject"]["title"],
-            short_subject_title=item["plan"]["subject"]["short"]
-        )
-        lessons.append(lesson)
+@dataclass
+class FetchResult:
+    group_id: int
+    start: int
+    lessons: list[Lesson] | None
+    not_modified: bool = False
+    digest: str | None = None
+    raw: bytes | None = None
+    encoding: str = 'identity'
+    etag: str | None = None
+    last_modified: str | None = None
+
+
+def stream_decoder(content_encoding: str) -> Callable[[bytes], bytes]:
+    # Кодировки применяются по порядку, снимаем их с конца
+    decoders = []
+    for encoding in reversed([e.strip().lower() for e in content_encoding.split(',') if e.strip()]):
+        factory = DECODERS.get(encoding)
+        if factory is None:
+            raise ScheduleApiError(200, f"unsupported Content-Encoding {encoding}")
+        decoders.append(factory())
+
+    def feed(chunk: bytes) -> bytes:
+        for decoder in decoders:
+            chunk = decoder(chunk)
+        return chunk
+    return feed
+
+
+def iter_decoded(chunks: Iterable[bytes], content_encoding: str) -> Iterator[bytes]:
+    feed = stream_decoder(content_encoding)
+    for chunk in chunks:
+        data = feed(chunk)
+        if data:
+            yield data
+
+
+def iter_chunks(raw: bytes | memoryview, size: int = CHUNK_SIZE) -> Iterator[bytes]:
+    for offset in range(0, len(raw), size):
+        yield raw[offset:offset + size]
+
+
+def decode_body(data: bytes, content_encoding: str) -> bytes:
+    return stream_decoder(content_encoding)(data)
+
+
+def body_digest(raw: bytes | memoryview, content_encoding: str) -> str:
+    digest = hashlib.sha256()
+    for data in iter_decoded(iter_chunks(raw), content_encoding):
+        digest.update(data)
+    return digest.hexdigest()
+
+
+class ItemStream:
+    # Достает объекты из массива "items" по мере поступления текста, не держа весь документ
+    def __init__(self):
+        self._decoder = json.JSONDecoder()
+        self._buf = ""
+        self._in_items = False
+        self._done = False
+        # Разбор текста до массива: глубина вложенности, строки и последний ключ верхнего уровня
+        self._pos = 0
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._string_start = 0
+        self._last_string = None
+        self._key = None
+
+    def _find_items(self) -> bool:
+        buf = self._buf
+        pos = self._pos
+        while pos < len(buf):
+            ch = buf[pos]
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == '\\':
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+                    if self._depth == 1:
+                        self._last_string = buf[self._string_start:pos]
+            elif ch == '"':
+                self._in_string = True
+                self._string_start = pos + 1
+            elif ch == ':' and self._depth == 1:
+                self._key = self._last_string
+            elif ch == ',' and self._depth == 1:
+                self._key = None
+            elif ch in '{[':
+                # Нужен только ключ "items" самого внешнего объекта
+                if ch == '[' and self._depth == 1 and self._key == 'items':
+                    self._buf = buf[pos + 1:]
+                    return True
+                self._depth += 1
+            elif ch in '}]':
+                self._depth -= 1
+            pos += 1
+        self._pos = pos
+        return False
+
+    def feed(self, text: str) -> list[dict]:
+        if self._done:
+            return []
+        self._buf += text
+        if not self._in_items:
+            if not self._find_items():
+                return []
+            self._in_items = True
+
+        items = []
+        pos = 0
+        buf = self._buf
+        while True:
+            while pos < len(buf) and buf[pos] in ' \t\r\n,':
+                pos += 1
+            if pos >= len(buf):
+                break
+            if buf[pos] == ']':
+                self._done = True
+                break
+            try:
+                item, pos = self._decoder.raw_decode(buf, pos)
+            except json.JSONDecodeError:
+                break
+            items.append(item)
+        self._buf = buf[pos:]
+        return items
+
+    def close(self) -> list[dict]:
+        if self._done:
+            return []
+        if self._in_items:
+            raise ScheduleApiError(200, "unexpected end of items array")
+        # Массив так и не нашелся: документ целиком в буфере, разбираем обычным способом
+        try:
+            document = json.loads(self._buf)
+        except json.JSONDecodeError as e:
+            raise ScheduleApiError(200, f"invalid schedule payload: {e}")
+        items = document.get('items') if isinstance(document, dict) else None
+        if not isinstance(items, list):
+            raise ScheduleApiError(200, "no items array in schedule payload")
+        return items
+
+
+def iter_items(chunks: Iterable[bytes]) -> Iterator[dict]:
+    text = codecs.getincrementaldecoder("utf-8")()
+    stream = ItemStream()
+    for chunk in chunks:
+        yield from stream.feed(text.decode(chunk))
+    yield from stream.feed(text.decode(b"", final=True))
+    yield from stream.close()
+
 
+def _intern(value):
+    # Необязательные поля могут прийти null
+    return sys.intern(value) if isinstance(value, str) else value
+
+
+def lesson_from_item(item: dict) -> Lesson:
+    # Преподаватели, аудитории и предметы повторяются из урока в урок
+    return Lesson(
+        date=datetime.fromtimestamp(item["date"]).strftime('%Y-%m-%d'),
+        sort=item["sort"],
+        classroom_id=item["classroomId"],
+        subgroup=item["subgroup"],
+        start=item["start"],
+        end=item["end"],
+        teacher_full=_intern(item["teacher"]["full"]),
+        teacher_birthday=item["teacher"]["birthDate"],
+        classroom_title=_intern(item["classroom"]["title"]),
+        subject_title=_intern(item["plan"]["subject"]["title"]),
+        short_subject_title=_intern(item["plan"]["subject"]["short"])
+    )
+
+
+def parse_items(items: Iterable[dict]) -> List[Lesson]:
+    lessons = [lesson_from_item(item) for item in items]
     lessons.sort(key=lambda x: (x.date, x.sort))
-    return lessons
\ No newline at end of file
+    return lessons
+
+
+def parse_payload(raw: bytes | memoryview, content_encoding: str) -> List[Lesson]:
+    return parse_items(iter_items(iter_decoded(iter_chunks(raw), content_encoding)))
+
+
+def week_range(data: int) -> tuple[int, int]:
+    start: int = int(arrow.get(data).floor('week').timestamp())
+    end: int = int(arrow.get(data).floor('week').shift(days=6).timestamp())
+    return start, end
+
+
+class ScheduleClient:
+    def __init__(self, host: str = API_HOST, token: str = "nke", connect_timeout: float = 5,
+                 read_timeout: float = 15, pool_size: int = 4, retries: int = 3, backoff_base: float = 0.5,
+                 backoff_max: float = 5, deadline: float = 30, breaker_threshold: int = 5,
+                 breaker_reset: float = 60):
+        self.base_url = f"https://{host}"
+        self.token = token
+        self.timeout = aiohttp.ClientTimeout(total=connect_timeout + read_timeout,
+                                             sock_connect=connect_timeout, sock_read=read_timeout)
+        self.pool_size = pool_size
+        self.retries = retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.deadline = deadline
+        self.breaker = resilience.CircuitBreaker(host, breaker_threshold, breaker_reset)
+
+        # Валидаторы последнего ответа: etag, last-modified и хеш тела
+        self._validators: dict[tuple[int, int], tuple[str | None, str | None, str]] = {}
+        self._session: aiohttp.ClientSession | None = None
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, name="schedule-client", daemon=True)
+        self._thread.start()
+
+    def _headers(self) -> dict[str, str]:
+        return {
+            'Accept': "application/json, text/plain, */*",
+            'Accept-Encoding': ACCEPT_ENCODING,
+            'Accept-Language': "ru-RU,ru;q=0.9,en-US;q=0.8,en;q=0.7",
+            'Authorization': f"Bearer {self.token}",
+            'Connection': "keep-alive",
+            'DNT': "1",
+            'Origin': "http://www.nke.ru",
+            'Referer': "http://www.nke.ru/",
+            'Sec-Fetch-Dest': "empty",
+            'Sec-Fetch-Mode': "cors",
+            'Sec-Fetch-Site': "cross-site",
+            'Sec-GPC': "1",
+            'User-Agent': "Mozilla/5.0 (X11; Linux x86_64; rv:147.0) Gecko/20100101 Firefox/147.0"
+        }
+
+    async def _get_session(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(limit=self.pool_size, keepalive_timeout=60, ttl_dns_cache=300)
+            self._session = aiohttp.ClientSession(
+                base_url=self.base_url,
+                connector=connector,
+                timeout=self.timeout,
+                headers=self._headers(),
+                auto_decompress=False,
+            )
+        return self._session
+
+    async def fetch(self, data: int, group_id: int = GROUP_ID, conditional: bool = True) -> FetchResult:
+        return await resilience.call(lambda: self._fetch_once(data, group_id, conditional), self.breaker,
+                                     self.retries, self.backoff_base, self.backoff_max, self.deadline)
+
+    async def _fetch_once(self, data: int, group_id: int, conditional: bool) -> FetchResult:
+        start, end = week_range(data)
+        key = (group_id, start)
+        etag, last_modified, digest = self._validators.get(key, (None, None, None))
+
+        headers = {}
+        if conditional and etag:
+            headers['If-None-Match'] = etag
+        if conditional and last_modified:
+            headers['If-Modified-Since'] = last_modified
+
+        session = await self._get_session()
+        params = {'start': start, 'end': end, 'groupId': group_id}
+        async with session.get("/schedule", params=params, headers=headers) as res:
+            if res.status == 304:
+                log.info(f"Schedule group {group_id} not modified (304)")
+                return FetchResult(group_id, start, None, not_modified=True, digest=digest)
+            if res.status != 200:
+                raise ScheduleApiError(res.status, (await res.text(errors='replace'))[:200])
+
+            encoding = res.headers.get('Content-Encoding', 'identity')
+            new_etag = res.headers.get('ETag')
+            new_last_modified = res.headers.get('Last-Modified')
+
+            # Сжатое тело держим целиком (оно нужно для снимка), разжатое - только по чанкам
+            feed = stream_decoder(encoding)
+            digest_obj = hashlib.sha256()
+            raw_chunks = []
+            async for chunk in res.content.iter_chunked(CHUNK_SIZE):
+                raw_chunks.append(chunk)
+                digest_obj.update(feed(chunk))
+            raw = b"".join(raw_chunks)
+
+        # Валидаторы запоминаются только после сохранения расписания, см. commit()
+        new_digest = digest_obj.hexdigest()
+
+        if conditional and new_digest == digest:
+            log.info(f"Schedule group {group_id} payload unchanged, skip parsing")
+            return FetchResult(group_id, start, None, not_modified=True, digest=new_digest, raw=raw, encoding=encoding,
+                               etag=new_etag, last_modified=new_last_modified)
+
+        lessons = parse_payload(raw, encoding)
+        return FetchResult(group_id, start, lessons, digest=new_digest, raw=raw, encoding=encoding,
+                           etag=new_etag, last_modified=new_last_modified)
+
+    def prime(self, group_id: int, start: int, etag: str | None, last_modified: str | None, digest: str) -> None:
+        self._validators.setdefault((group_id, start), (etag, last_modified, digest))
+
+    def commit(self, result: FetchResult) -> None:
+        # На 304 тела нет и валидаторы прежние
+        if result.raw is None:
+            return
+        self._validators[(result.group_id, result.start)] = (result.etag, result.last_modified, result.digest)
+
+    async def fetch_many(self, requests: list[tuple[int, int]],
+                         concurrency: int) -> dict[tuple[int, int], FetchResult | Exception]:
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def bounded(data: int, group_id: int):
+            async with semaphore:
+                return await self.fetch(data, group_id)
+
+        results = await asyncio.gather(*(bounded(data, group_id) for data, group_id in requests),
+                                       return_exceptions=True)
+        return dict(zip(requests, results))
+
+    def run(self, coro, timeout: float | None = None):
+        return asyncio.run_coroutine_threadsafe(coro, self._loop).result(timeout)
+
+    def fetch_sync(self, data: int, group_id: int = GROUP_ID, conditional: bool = True) -> FetchResult:
+        return self.run(self.fetch(data, group_id, conditional), timeout=self.deadline + 1)
+
+    def fetch_many_sync(self, requests: list[tuple[int, int]],
+                        concurrency: int) -> dict[tuple[int, int], FetchResult | Exception]:
+        return self.run(self.fetch_many(requests, concurrency))
+
+    def close(self) -> None:
+        if self._session is not None:
+            self.run(self._session.close(), timeout=5)
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join(timeout=5)
+        log.info("Schedule client closed")
+
+
+_client: ScheduleClient | None = None
+_client_lock = threading.Lock()
+
+
+def default_client() -> ScheduleClient:
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = ScheduleClient()
+        return _client
+
+
+def parse_schedule(data: int, group_id: int = GROUP_ID) -> List[Lesson]:
+    log.info(f"Fetch schedule for group {group_id}")
+    return default_client().fetch_sync(data, group_id, conditional=False).lessons
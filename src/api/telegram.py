@@ -1,21 +1,73 @@
+import asyncio
 import telebot
 import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
 from datetime import datetime, timedelta
 
 import src.config.token
 import src.app.image.app as image_gen
+import src.app.image.assets as image_assets
+import src.app.image.encoders as encoders
+from src.app.image.service import RenderService, RenderQueueFull
+from src.api.dispatcher import ChatDispatcher
+from src.api.outbox import Outbox, Sender, INTERACTIVE, BULK
+from src.api.webhook import WebhookServer
 import src.api.ai as ai
+import src.app.schedule.text as text_view
+from src.app.db.changes import ChangeSet
+from src.app.db.rows import ScheduleDay, count_lessons
+import src.lib.date_utils as dutils
 from app.schedule.app import Schedule
 from config.config import Config
+from src.lib.single_flight import SingleFlight
 
 log = logging.getLogger(__name__)
 
+MAX_WEEK_OFFSET = 8
+
 
 class TGBot:
     def __init__(self, cfg: Config, schedule: Schedule):
         self.cfg = cfg
         self.schedule = schedule
-        self.bot = telebot.TeleBot(src.config.token.TOKEN)
+        # Апдейты раздает ChatDispatcher, хендлеры выполняются в его пуле потоков
+        self.bot = telebot.TeleBot(src.config.token.TOKEN, threaded=False)
+        self.render_flight = SingleFlight()
+        # Опечатка в профиле должна остановить запуск, а не каждый /schedule
+        encoders.check_profile(cfg.render_encoder)
+        image_assets.configure(cfg.render_font_dirs, cfg.render_fonts)
+        image_gen.preload_assets()
+        image_gen.configure_tiles(cfg.render_tile_cache_size)
+        self.render_service = None
+        if cfg.render_workers > 0:
+            self.render_service = RenderService(cfg.render_workers, cfg.render_queue_size, cfg.render_queue_timeout,
+                                                cfg.render_font_dirs, cfg.render_fonts,
+                                                cfg.render_tile_cache_size).start()
+        self.render_cache = image_gen.RenderCache(
+            cfg.render_cache_size, cfg.render_cache_path,
+            renderer=self.render_service.render if self.render_service else None,
+        )
+
+        self.views: dict[int, str] = schedule.data.get_user_views()
+        self.groups: dict[int, int] = schedule.data.get_chat_groups()
+        self._touched: dict[int, float] = {}
+
+        self.outbox = Outbox(cfg.outbox_global_rate, cfg.outbox_chat_rate, cfg.outbox_chat_burst,
+                             cfg.outbox_group_per_minute, cfg.outbox_workers).start()
+        self.out = Sender(self.bot, self.outbox, INTERACTIVE)
+        # Запросы к модели идут через свою очередь и не занимают потоки хендлеров
+        self.inference = ai.InferenceQueue(cfg.ai_workers, cfg.ai_queue_size, cfg.ai_max_pending_per_user,
+                                           cfg.ai_per_user_per_hour, cfg.ai_deadline, cfg.ai_model).start()
+
+        schedule.add_listener(self.notify_changes)
+
+        self._handlers = ThreadPoolExecutor(max_workers=cfg.bot_concurrency, thread_name_prefix="tg-handler")
+        self._poller = ThreadPoolExecutor(max_workers=1, thread_name_prefix="tg-poll")
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._stopping: asyncio.Event | None = None
+        self.dispatcher: ChatDispatcher | None = None
 
         self.register_handlers()
 
@@ -26,7 +78,42 @@ class TGBot:
 
         @self.bot.message_handler(commands=['schedule'])
         def send_schedule_wrapper(message):
-            self.send_schedule_image(message)
+            if self.views.get(message.chat.id) == 'text':
+                self.send_week_text(message, self._week_offset(message))
+            else:
+                self.send_schedule_image(message, self._week_offset(message))
+
+        @self.bot.message_handler(commands=['today'])
+        def send_today_wrapper(message):
+            self.send_day_text(message, 0)
+
+        @self.bot.message_handler(commands=['tomorrow'])
+        def send_tomorrow_wrapper(message):
+            self.send_day_text(message, 1)
+
+        @self.bot.message_handler(commands=['next'])
+        def send_next_wrapper(message):
+            self.send_next_lesson(message)
+
+        @self.bot.message_handler(commands=['week'])
+        def send_week_wrapper(message):
+            self.send_week_text(message, self._week_offset(message))
+
+        @self.bot.message_handler(commands=['group'])
+        def set_group_wrapper(message):
+            self.set_group(message)
+
+        @self.bot.message_handler(commands=['mode'])
+        def set_view_wrapper(message):
+            self.set_view(message)
+
+        @self.bot.message_handler(commands=['subscribe'])
+        def subscribe_wrapper(message):
+            self.subscribe(message)
+
+        @self.bot.message_handler(commands=['unsubscribe'])
+        def unsubscribe_wrapper(message):
+            self.unsubscribe(message)
 
         @self.bot.message_handler(commands=['thinking_ai'])
         def ai_handler_wrapper(message):
@@ -42,6 +129,14 @@ class TGBot:
 
     <b>Доступные команды:</b>
     /schedule - Получить расписание на текущую неделю
+    /schedule 1 - Следующая неделя, /schedule -1 - прошлая
+    /today - Занятия на сегодня
+    /tomorrow - Занятия на завтра
+    /next - Ближайшее занятие
+    /week - Расписание недели текстом
+    /mode text|image - Вид расписания по умолчанию
+    /group номер - Выбрать учебную группу
+    /subscribe - Присылать изменения расписания, /unsubscribe - отписаться
     /thinking_ai - Использовать более продвинутую нейросеть
     <b>Особенности:</b>
     • Автоматическое обновление расписания
@@ -50,90 +145,332 @@ class TGBot:
 
     Для начала работы просто нажмите /schedule
         """
-        self.bot.send_message(message.chat.id, welcome_text, parse_mode='HTML')
+        self.out.send_message(message.chat.id, welcome_text, parse_mode='HTML')
 
-    def send_schedule_image(self, message):
+    def send_schedule_image(self, message, week_offset: int = 0):
         try:
-            today = datetime.now().date()
-            start_date = today - timedelta(days=today.weekday())
+            schedule_key, schedule_days = self.schedule.current(self._group(message), week_offset)
+            start_date = dutils.day_to_date(schedule_key[1])
             end_date = start_date + timedelta(days=6)
+            lessons_total = count_lessons(schedule_days)
 
-            log.info(f"Get {start_date} {end_date}")
+            log.info(f"Get {start_date} {end_date}, lessons: {lessons_total}")
 
-            schedule_data = self.schedule.get()
-            log.info(f"Get {len(schedule_data) if schedule_data else 0}")
-
-            if not schedule_data:
-                self.bot.send_message(message.chat.id,
+            if not schedule_days:
+                self.out.send_message(message.chat.id,
                                       "На эту неделю расписание не найдено.\n\n"
                                       "Возможно, занятия еще не добавлены или вы выбрали не учебную неделю.",
                                       parse_mode='HTML')
                 return
 
-            if schedule_data:
-                sample_lesson = schedule_data[0]
-                log.info(f"lessons: {list(sample_lesson.keys())}")
-
-            img_bytes = image_gen.generate_schedule_image(schedule_data)
-
             caption = f"""
     📅 <b>Расписание занятий</b>
     🗓️ Период: {start_date.strftime('%d.%m')} - {end_date.strftime('%d.%m.%Y')}
-    👥 Всего занятий: {len(schedule_data)}
+    👥 Всего занятий: {lessons_total}
     ⏰ Время генерации: {datetime.now().strftime('%H:%M')}
+    {text_view.format_stale(self.schedule.stale_since(schedule_key[0], schedule_key[1]))}
 
     <i>Для обновления расписания используйте команду /schedule</i>
             """
 
-            self.bot.send_photo(message.chat.id, img_bytes,
-                                caption=caption,
-                                parse_mode='HTML')
+            self._send_schedule_photo(message.chat.id, schedule_key, schedule_days, caption)
 
             log.info(f"Send schedule {message.from_user.id}")
 
+        except RenderQueueFull as e:
+            log.warning(f"Render queue is full: {e}")
+            self.out.reply_to(message,
+                              "⏳ Сейчас много запросов расписания.\n"
+                              "Попробуйте повторить через несколько секунд.")
         except Exception as e:
             log.error(f"Error gen: {str(e)}", exc_info=True)
-            self.bot.reply_to(message,
+            self.out.reply_to(message,
                               "❌ Произошла ошибка при генерации расписания.\n"
                               "Попробуйте позже или обратитесь к администратору.")
 
-    def ai_handler(self, message):
+    def send_day_text(self, message, offset: int):
         try:
-            command_parts = message.text.split(maxsplit=1)
-            if len(command_parts) < 2:
-                self.bot.reply_to(message, "Пожалуйста, напишите ваш вопрос после команды /thinking_ai")
-                return
+            day = datetime.now().date() + timedelta(days=offset)
+            lessons = self.schedule.lessons_on(day, self._group(message))
+            self.out.send_message(message.chat.id, text_view.format_day(day.isoformat(), lessons),
+                                  parse_mode='HTML')
+        except Exception as e:
+            log.error(f"Error day schedule: {str(e)}", exc_info=True)
+            self.out.reply_to(message, "❌ Не удалось получить расписание. Попробуйте позже.")
 
-            user_query = command_parts[1]
-            response = ai.thinking_request(user_query)
-            log.info(f"Question: {user_query}, Request: {response}")
-            self.bot.reply_to(message, response)
+    def send_next_lesson(self, message):
+        try:
+            now = datetime.now()
+            lesson = text_view.find_next(self.schedule.upcoming(now, self._group(message)), now)
+            self.out.send_message(message.chat.id, text_view.format_next(lesson, now), parse_mode='HTML')
+        except Exception as e:
+            log.error(f"Error next lesson: {str(e)}", exc_info=True)
+            self.out.reply_to(message, "❌ Не удалось получить расписание. Попробуйте позже.")
 
+    def send_week_text(self, message, week_offset: int = 0):
+        try:
+            (group_id, week, _), schedule_days = self.schedule.current(self._group(message), week_offset)
+            text = text_view.format_week_html(schedule_days)
+            stale = text_view.format_stale(self.schedule.stale_since(group_id, week))
+            if stale:
+                text = f"{stale}\n\n{text}"
+            self.out.send_message(message.chat.id, text, parse_mode='HTML')
         except Exception as e:
-            log.error(f"Error ai request: {str(e)}", exc_info=True)
-            self.bot.reply_to(message, "Произошла ошибка при обработке запроса. Попробуйте позже.")
+            log.error(f"Error week text: {str(e)}", exc_info=True)
+            self.out.reply_to(message, "❌ Не удалось получить расписание. Попробуйте позже.")
+
+    @staticmethod
+    def _week_offset(message) -> int:
+        args = (message.text or "").split()[1:]
+        try:
+            return max(-MAX_WEEK_OFFSET, min(MAX_WEEK_OFFSET, int(args[0]))) if args else 0
+        except ValueError:
+            return 0
+
+    def _group(self, message) -> int:
+        chat_id = message.chat.id
+        group_id = self.groups.get(chat_id)
+        if group_id is None:
+            return self.schedule.default_group
+        # Отмечаем активность не чаще раза в сутки, чтобы группа не выпала из фонового обновления
+        now = time.monotonic()
+        if now - self._touched.get(chat_id, float('-inf')) >= 86400:
+            self._touched[chat_id] = now
+            self.schedule.data.touch_chat_group(chat_id)
+        return group_id
+
+    def set_group(self, message):
+        command_parts = message.text.split(maxsplit=1)
+        if len(command_parts) < 2 or not command_parts[1].strip().isdigit():
+            self.out.reply_to(message, f"Текущая группа: {self._group(message)}. "
+                                       f"Используйте /group номер, например /group {self.schedule.default_group}")
+            return
+
+        group_id = int(command_parts[1].strip())
+        if group_id != self.schedule.default_group and group_id not in self.groups.values():
+            # Новую группу сначала проверяем на API, чтобы не обновлять в фоне несуществующие
+            found = self.schedule.load_group(group_id)
+            if found is None:
+                self.out.reply_to(message, "Не удалось проверить группу, сервер расписания недоступен. "
+                                           "Попробуйте позже.")
+                return
+            if not found:
+                self.out.reply_to(message, f"Группа {group_id} не найдена или у нее нет занятий.")
+                return
+        else:
+            self.schedule.refresh_async(group_id)
+        self.groups[message.chat.id] = group_id
+        self._touched[message.chat.id] = time.monotonic()
+        self.schedule.data.set_chat_group(message.chat.id, group_id)
+        self.out.reply_to(message, f"Группа {group_id} выбрана.")
+
+    def set_view(self, message):
+        command_parts = message.text.split(maxsplit=1)
+        view = command_parts[1].strip().lower() if len(command_parts) > 1 else ''
+        if view not in ('text', 'image'):
+            current = self.views.get(message.chat.id, 'image')
+            self.out.reply_to(message, f"Сейчас: {current}. Используйте /mode text или /mode image")
+            return
+
+        self.views[message.chat.id] = view
+        self.schedule.data.set_user_view(message.chat.id, view)
+        self.out.reply_to(message, "Теперь /schedule присылает " +
+                          ("текст" if view == 'text' else "картинку"))
+
+    def subscribe(self, message):
+        if self.schedule.data.subscribe(message.chat.id):
+            self.out.reply_to(message, f"🔔 Буду присылать изменения расписания группы {self._group(message)}. "
+                                       f"Отписаться: /unsubscribe")
+        else:
+            self.out.reply_to(message, "Вы уже подписаны. Отписаться: /unsubscribe")
+
+    def unsubscribe(self, message):
+        if self.schedule.data.unsubscribe(message.chat.id):
+            self.out.reply_to(message, "🔕 Подписка на изменения отключена.")
+        else:
+            self.out.reply_to(message, "Подписки нет. Подписаться: /subscribe")
+
+    def notify_changes(self, group_id: int, week: int, changes: ChangeSet):
+        chats = self.schedule.data.subscribers(group_id, self.schedule.default_group)
+        if not chats:
+            return
+        text = text_view.format_changes(group_id, changes)
+        for chat_id in chats:
+            future = self.outbox.submit(chat_id, self.bot.send_message, chat_id, text, parse_mode='HTML',
+                                        priority=BULK)
+            future.add_done_callback(lambda f, chat_id=chat_id: self._notify_done(chat_id, f))
+        log.info(f"Queued schedule changes of group {group_id} to {len(chats)} chats: {changes}")
+
+    def _notify_done(self, chat_id: int, future):
+        error = future.exception()
+        # Бот заблокирован или чат удален - подписка больше не нужна
+        if isinstance(error, telebot.apihelper.ApiTelegramException) and (
+                error.error_code == 403 or 'chat not found' in error.description):
+            log.info(f"Unsubscribe chat {chat_id}: {error.description}")
+            self.schedule.data.unsubscribe(chat_id)
+
+    def _render_options(self) -> dict:
+        # Те же параметры, что и в ключе RenderCache: другая картинка - другой file_id
+        return {'profile': self.cfg.render_encoder}
+
+    def _render_schedule(self, schedule_days: list[ScheduleDay]) -> bytes:
+        _, img_bytes = self.render_cache.render(schedule_days, **self._render_options())
+        return img_bytes
+
+    def _send_schedule_photo(self, chat_id, schedule_key: tuple, schedule_days: list[ScheduleDay], caption: str):
+        group_id, week, _ = schedule_key
+        content_hash = image_gen.schedule_hash(schedule_days, **self._render_options())
+
+        file_id = self.schedule.data.get_file_id(content_hash)
+        if file_id is not None:
+            try:
+                return self.out.send_photo(chat_id, file_id, caption=caption, parse_mode='HTML')
+            except telebot.apihelper.ApiTelegramException as e:
+                log.warning(f"Cached file_id rejected, upload again: {e}")
+                self.schedule.data.forget_file_id(content_hash)
+
+        img_bytes = BytesIO(self.render_flight.do(("render", *schedule_key),
+                                                  self._render_schedule, schedule_days))
+        sent = self.out.send_photo(chat_id, img_bytes, caption=caption, parse_mode='HTML')
+        if sent and sent.photo:
+            self.schedule.data.save_file_id(content_hash, sent.photo[-1].file_id, group_id, week)
+        return sent
+
+    def ai_handler(self, message):
+        command_parts = message.text.split(maxsplit=1)
+        if len(command_parts) < 2:
+            self.out.reply_to(message, "Пожалуйста, напишите ваш вопрос после команды /thinking_ai")
+            return
+        self._ask_ai(message, command_parts[1])
 
     def ai_response(self, message):
         if message.text.startswith('/'):
             return
+        self._ask_ai(message, message.text)
 
+    def _ask_ai(self, message, user_query: str):
+        user_id = message.from_user.id if message.from_user else message.chat.id
         try:
-            response = ai.thinking_request(message.text)
-            log.info(f"Question: {message.text}, Request: {response}")
-            self.bot.reply_to(message, response)
-        except Exception as e:
-            log.error(f"Error ai request: {str(e)}", exc_info=True)
-            self.bot.reply_to(message, "Произошла ошибка при обработке запроса. Попробуйте позже.")
+            future, position = self.inference.submit(user_id, user_query)
+        except ai.QuotaExceeded as e:
+            log.info(f"AI quota for user {user_id}: {e}")
+            if e.retry_in:
+                self.out.reply_to(message, f"Лимит запросов исчерпан, попробуйте через {int(e.retry_in // 60) + 1} мин.")
+            else:
+                self.out.reply_to(message, "Дождитесь ответа на предыдущие вопросы.")
+            return
+        except ai.QueueFull as e:
+            log.warning(f"AI queue rejected request: {e}")
+            self.out.reply_to(message, "Сейчас слишком много запросов. Попробуйте позже.")
+            return
+
+        if position > 0:
+            self.out.reply_to(message, f"Ваш запрос в очереди: {position}")
+        future.add_done_callback(lambda f: self._ai_done(message, user_query, f))
+
+    def _ai_done(self, message, user_query: str, future):
+        # Вызывается в потоке модели, поэтому ответ только ставится в очередь отправки
+        if future.cancelled():
+            return
+        error = future.exception()
+        if error is None:
+            response = future.result()
+            log.info(f"Question: {user_query}, Request: {response}")
+        elif isinstance(error, TimeoutError):
+            log.warning(f"AI request of chat {message.chat.id} expired: {error}")
+            response = "Модель не успела ответить. Попробуйте позже."
+        else:
+            log.error(f"Error ai request: {str(error)}", exc_info=error)
+            response = "Произошла ошибка при обработке запроса. Попробуйте позже."
+        try:
+            self.outbox.submit(message.chat.id, self.bot.reply_to, message, response)
+        except RuntimeError as e:
+            log.warning(f"AI answer for chat {message.chat.id} dropped: {e}")
+
+    async def _handle(self, update) -> None:
+        await self._loop.run_in_executor(self._handlers, self.bot.process_new_updates, [update])
+
+    async def _poll(self, offset: int | None) -> list:
+        return await self._loop.run_in_executor(self._poller, lambda: self.bot.get_updates(
+            offset=offset, timeout=self.cfg.bot_poll_timeout, long_polling_timeout=self.cfg.bot_poll_timeout))
+
+    async def run(self):
+        self._loop = asyncio.get_running_loop()
+        self._stopping = asyncio.Event()
+        self.dispatcher = ChatDispatcher(self._handle, self.cfg.bot_concurrency, self.cfg.bot_queue_size)
+        log.info(f"Bot started in {self.cfg.bot_mode} mode, handlers: {self.cfg.bot_concurrency}")
+
+        try:
+            if self.cfg.bot_mode == 'webhook':
+                await self._run_webhook()
+            else:
+                await self._run_polling()
+        finally:
+            await self.dispatcher.close(self.cfg.bot_shutdown_timeout)
+            self.close()
+
+    async def _run_webhook(self):
+        # Секрет общий для всех процессов и для внешней регистрации вебхука, генерировать его нельзя
+        secret = self.cfg.webhook_secret
+        if not secret:
+            raise RuntimeError("Webhook mode requires bot.webhook_secret or UNIBOT_WEBHOOK_SECRET")
+
+        server = await WebhookServer(self.dispatcher, secret, self.cfg.webhook_path, self.cfg.webhook_host,
+                                     self.cfg.webhook_port, self.cfg.webhook_reuse_port).start()
+        try:
+            if self.cfg.webhook_url:
+                await self._loop.run_in_executor(self._poller, lambda: self.bot.set_webhook(
+                    url=self.cfg.webhook_url, secret_token=secret, max_connections=self.cfg.bot_concurrency))
+                log.info(f"Webhook registered at {self.cfg.webhook_url}")
+            await self._stopping.wait()
+        finally:
+            await server.stop()
+
+    async def _run_polling(self):
+        offset = None
+        errors = 0
+        stopping = asyncio.create_task(self._stopping.wait())
+        try:
+            while not self._stopping.is_set():
+                poll = asyncio.ensure_future(self._poll(offset))
+                await asyncio.wait({poll, stopping}, return_when=asyncio.FIRST_COMPLETED)
+                if not poll.done():
+                    poll.cancel()
+                    break
+                try:
+                    updates = poll.result()
+                    errors = 0
+                except Exception as e:
+                    errors += 1
+                    delay = min(60, 2 ** errors)
+                    log.error(f"Error getting updates: {e}, retry in {delay} s")
+                    await asyncio.wait({stopping}, timeout=delay)
+                    continue
+
+                for update in updates:
+                    offset = update.update_id + 1
+                    await self.dispatcher.submit(update)
+        finally:
+            stopping.cancel()
 
     def start(self):
-        log.info("Bot started")
-        self.bot.infinity_polling()
+        asyncio.run(self.run())
         return self
 
     def stop(self):
-        try:
-            self.bot.stop_polling()
-        except AttributeError:
+        if self._loop is None or self._stopping is None or self._loop.is_closed():
             log.warning("Bot already stopped")
+            return
+        self._loop.call_soon_threadsafe(self._stopping.set)
+        log.info("Bot stopping")
 
+    def close(self):
+        self._poller.shutdown(wait=False, cancel_futures=True)
+        self._handlers.shutdown(wait=False, cancel_futures=True)
+        self.inference.stop()
+        self.outbox.stop(self.cfg.bot_shutdown_timeout)
+        if self.render_service:
+            self.render_service.stop()
+        log.info(f"Render cache hits: {self.render_cache.hits}, misses: {self.render_cache.misses}, "
+                 f"encoders: {encoders.stats.summary()}")
         log.info("Bot stop")
\ No newline at end of file
@@ -0,0 +1,74 @@
+import hmac
+import json
+
+from aiohttp import web
+from telebot import types
+
+import logging
+
+from src.api.dispatcher import ChatDispatcher
+
+log: logging.Logger = logging.getLogger(__name__)
+
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+
+class WebhookServer:
+    def __init__(self, dispatcher: ChatDispatcher, secret: str, path: str = "/telegram",
+                 host: str = "127.0.0.1", port: int = 8080, reuse_port: bool = True,
+                 max_body_size: int = 1024 * 1024):
+        self.dispatcher = dispatcher
+        self.secret = secret
+        self.path = path
+        self.host = host
+        self.port = port
+        self.reuse_port = reuse_port
+        self.app = web.Application(client_max_size=max_body_size)
+        self.app.router.add_post(path, self.handle_update)
+        self.app.router.add_get("/healthz", self.health)
+        self._runner: web.AppRunner | None = None
+        self.accepted = 0
+        self.rejected = 0
+
+    async def handle_update(self, request: web.Request) -> web.Response:
+        token = request.headers.get(SECRET_HEADER, "")
+        if not hmac.compare_digest(token.encode(), self.secret.encode()):
+            self.rejected += 1
+            log.warning(f"Webhook request from {request.remote} with wrong secret token")
+            return web.Response(status=401)
+
+        try:
+            update = types.Update.de_json(json.loads(await request.read()))
+        except (ValueError, TypeError, KeyError) as e:
+            log.warning(f"Bad webhook payload: {e}")
+            return web.Response(status=400)
+
+        # Отвечаем сразу; при переполнении Telegram повторит доставку сам
+        if not self.dispatcher.offer(update):
+            self.rejected += 1
+            return web.Response(status=503, headers={'Retry-After': "1"})
+        self.accepted += 1
+        return web.Response()
+
+    async def health(self, request: web.Request) -> web.Response:
+        return web.json_response({
+            'pending': self.dispatcher.pending,
+            'handled': self.dispatcher.handled,
+            'accepted': self.accepted,
+            'rejected': self.rejected,
+        })
+
+    async def start(self) -> "WebhookServer":
+        self._runner = web.AppRunner(self.app, access_log=None)
+        await self._runner.setup()
+        # reuse_port позволяет нескольким процессам слушать один порт
+        site = web.TCPSite(self._runner, self.host, self.port, reuse_port=self.reuse_port)
+        await site.start()
+        log.info(f"Webhook server listening on {self.host}:{self.port}{self.path}")
+        return self
+
+    async def stop(self) -> None:
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+        log.info(f"Webhook server stopped, accepted: {self.accepted}, rejected: {self.rejected}")
@@ -1,3 +1,5 @@
+import asyncio
+
 from api.telegram import TGBot
 from config.config import Config
 from src.app.schedule.app import Schedule
@@ -9,12 +11,24 @@ class App:
         self.cfg = Config()
         logger.configure(self.cfg)
         self.schedule = Schedule(self.cfg)
-        self.tg_bot = TGBot(self.cfg, self.schedule).start()
+        # Бот подписывается на изменения до первого обновления, иначе изменения за время простоя потеряются
+        self.tg_bot = TGBot(self.cfg, self.schedule)
+        self.schedule.start()
+
+    def run(self):
+        asyncio.run(self._main())
 
-        signal.signal(signal.SIGINT, self._signal_handler)
-        signal.signal(signal.SIGTERM, self._signal_handler)
+    async def _main(self):
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(sig, self._signal_handler)
+        try:
+            await self.tg_bot.run()
+        finally:
+            self.stop()
 
-    @staticmethod
     def _signal_handler(self):
         self.tg_bot.stop()
-        self.stop()
\ No newline at end of file
+
+    def stop(self):
+        self.schedule.stop()
@@ -0,0 +1,62 @@
+from dataclasses import dataclass, field
+
+from src.api.schadule_client import Lesson
+
+
+def lesson_key(lesson: Lesson) -> tuple:
+    return (lesson.subject_title, lesson.teacher_full, lesson.classroom_title,
+            lesson.start, lesson.end, lesson.subgroup is not None)
+
+
+@dataclass
+class ChangeSet:
+    added: list[Lesson] = field(default_factory=list)
+    removed: list[Lesson] = field(default_factory=list)
+    moved: list[tuple[Lesson, Lesson]] = field(default_factory=list)
+    dates: set[str] = field(default_factory=set)
+    # Раньше по этим датам ничего не хранилось: первая загрузка, а не изменение
+    initial: bool = False
+
+    def __bool__(self) -> bool:
+        return bool(self.dates)
+
+    def __repr__(self):
+        return (f"ChangeSet(dates={sorted(self.dates)}, added={len(self.added)}, "
+                f"removed={len(self.removed)}, moved={len(self.moved)})")
+
+    def since(self, date: str) -> "ChangeSet":
+        return ChangeSet(
+            added=[lesson for lesson in self.added if lesson.date >= date],
+            removed=[lesson for lesson in self.removed if lesson.date >= date],
+            moved=[(old, new) for old, new in self.moved if new.date >= date],
+            dates={day for day in self.dates if day >= date},
+            initial=self.initial,
+        )
+
+    def add_day(self, date: str, old_lessons: list[Lesson], new_lessons: list[Lesson]) -> None:
+        old_keys = {}
+        for lesson in old_lessons:
+            old_keys.setdefault(lesson_key(lesson), []).append(lesson)
+
+        added = []
+        for lesson in new_lessons:
+            same = old_keys.get(lesson_key(lesson))
+            if same:
+                same.pop()
+            else:
+                added.append(lesson)
+        removed = [lesson for lessons in old_keys.values() for lesson in lessons]
+
+        # Занятие того же предмета у того же преподавателя считаем перенесенным
+        for new_lesson in list(added):
+            for old_lesson in removed:
+                if (old_lesson.subject_title == new_lesson.subject_title and
+                        old_lesson.teacher_full == new_lesson.teacher_full):
+                    self.moved.append((old_lesson, new_lesson))
+                    removed.remove(old_lesson)
+                    added.remove(new_lesson)
+                    break
+
+        self.added.extend(added)
+        self.removed.extend(removed)
+        self.dates.add(date)
@@ -0,0 +1,96 @@
+import sqlite3
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Iterator
+
+import logging
+
+log: logging.Logger = logging.getLogger(__name__)
+
+
+class ConnectionManager:
+    def __init__(self, path: Path, cache_size_kb: int = 8192, mmap_size: int = 64 * 1024 * 1024,
+                 cached_statements: int = 256, busy_timeout_ms: int = 5000):
+        self.path = path
+        self.cache_size_kb = cache_size_kb
+        self.mmap_size = mmap_size
+        self.cached_statements = cached_statements
+        self.busy_timeout_ms = busy_timeout_ms
+
+        self._local = threading.local()
+        self._write_lock = threading.RLock()
+        self._writer: sqlite3.Connection | None = None
+        self._connections: list[sqlite3.Connection] = []
+        self._connections_lock = threading.Lock()
+
+    def _connect(self, readonly: bool) -> sqlite3.Connection:
+        conn = sqlite3.connect(
+            self.path,
+            check_same_thread=False,
+            cached_statements=self.cached_statements,
+            timeout=self.busy_timeout_ms / 1000,
+        )
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute(f"PRAGMA cache_size=-{int(self.cache_size_kb)}")
+        conn.execute(f"PRAGMA mmap_size={int(self.mmap_size)}")
+        conn.execute("PRAGMA temp_store=MEMORY")
+        conn.execute(f"PRAGMA busy_timeout={int(self.busy_timeout_ms)}")
+        if readonly:
+            conn.execute("PRAGMA query_only=ON")
+
+        with self._connections_lock:
+            self._connections.append(conn)
+        log.debug(f"Opened {'reader' if readonly else 'writer'} connection to {self.path} "
+                  f"in {threading.current_thread().name}")
+        return conn
+
+    def reader(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._connect(readonly=True)
+            self._local.conn = conn
+        return conn
+
+    @contextmanager
+    def read(self) -> Iterator[sqlite3.Connection]:
+        # Внутри транзакции записи читаем через writer, чтобы видеть свои же изменения
+        if getattr(self._local, "writing", False):
+            yield self._writer
+            return
+        yield self.reader()
+
+    @contextmanager
+    def write(self) -> Iterator[sqlite3.Connection]:
+        with self._write_lock:
+            if self._writer is None:
+                self._writer = self._connect(readonly=False)
+            conn = self._writer
+
+            if getattr(self._local, "writing", False):
+                yield conn
+                return
+
+            self._local.writing = True
+            try:
+                yield conn
+                conn.commit()
+            except BaseException:
+                conn.rollback()
+                raise
+            finally:
+                self._local.writing = False
+
+    def close(self) -> None:
+        with self._connections_lock:
+            connections, self._connections = self._connections, []
+        for conn in connections:
+            try:
+                conn.close()
+            except sqlite3.Error as e:
+                log.warning(f"Error closing connection: {e}")
+        self._writer = None
+        self._local = threading.local()
+        log.info("All db connections closed")
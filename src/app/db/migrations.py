@@ -0,0 +1,144 @@
+import sqlite3
+from typing import Callable
+
+import logging
+
+from src.api.schadule_client import GROUP_ID
+
+log: logging.Logger = logging.getLogger(__name__)
+
+
+def _v1_base_schema(conn: sqlite3.Connection) -> None:
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS teacher (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT UNIQUE NOT NULL,
+            birthday INTEGER
+        )
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS lesson (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            id_teacher INTEGER NOT NULL,
+            name TEXT UNIQUE NOT NULL,
+            short TEXT,
+            FOREIGN KEY (id_teacher) REFERENCES teacher(id)
+        )
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS schedule (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            id_lesson INTEGER NOT NULL,
+            id_classroom INTEGER NOT NULL,
+            classroom TEXT NOT NULL,
+            lesson_plan INTEGER NOT NULL,
+            start INTEGER NOT NULL,
+            end INTEGER NOT NULL,
+            date TEXT NOT NULL,
+            flag_combine BOOL DEFAULT 0,
+            FOREIGN KEY (id_lesson) REFERENCES lesson(id)
+        )
+    """)
+
+
+def _v2_day_keys(conn: sqlite3.Connection) -> None:
+    # lesson.name и teacher.name уже проиндексированы через UNIQUE
+    conn.execute(f"ALTER TABLE schedule ADD COLUMN group_id INTEGER NOT NULL DEFAULT {GROUP_ID}")
+    conn.execute("ALTER TABLE schedule ADD COLUMN day INTEGER")
+    conn.execute("ALTER TABLE schedule ADD COLUMN week INTEGER")
+    conn.execute("ALTER TABLE schedule ADD COLUMN id_teacher INTEGER REFERENCES teacher(id)")
+    conn.execute("UPDATE schedule SET day = CAST(julianday(substr(date, 1, 10)) - 2440587.5 AS INTEGER)")
+    conn.execute("UPDATE schedule SET week = day - (day + 3) % 7")
+    conn.execute("""
+        UPDATE schedule SET id_teacher = (SELECT l.id_teacher FROM lesson l WHERE l.id = schedule.id_lesson)
+    """)
+    conn.execute("""
+        CREATE INDEX IF NOT EXISTS idx_schedule_group_week ON schedule (
+            group_id, week, day, start, "end", id_lesson, id_teacher,
+            id_classroom, classroom, lesson_plan, flag_combine, date
+        )
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_schedule_group_day ON schedule (group_id, day)")
+
+
+def _v3_telegram_files(conn: sqlite3.Connection) -> None:
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS tg_file (
+            hash TEXT PRIMARY KEY,
+            file_id TEXT NOT NULL,
+            group_id INTEGER NOT NULL,
+            week INTEGER NOT NULL,
+            created_at INTEGER NOT NULL
+        )
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_tg_file_group_week ON tg_file (group_id, week)")
+
+
+def _v4_user_preferences(conn: sqlite3.Connection) -> None:
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS user_pref (
+            chat_id INTEGER PRIMARY KEY,
+            view TEXT NOT NULL DEFAULT 'image'
+        )
+    """)
+
+
+def _v5_chat_groups(conn: sqlite3.Connection) -> None:
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS chat_group (
+            chat_id INTEGER PRIMARY KEY,
+            group_id INTEGER NOT NULL
+        )
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_chat_group_group ON chat_group (group_id)")
+
+
+def _v6_subscriptions(conn: sqlite3.Connection) -> None:
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS subscription (
+            chat_id INTEGER PRIMARY KEY,
+            created_at INTEGER NOT NULL DEFAULT (strftime('%s', 'now'))
+        )
+    """)
+
+
+def _v7_chat_group_activity(conn: sqlite3.Connection) -> None:
+    conn.execute("ALTER TABLE chat_group ADD COLUMN used_at INTEGER NOT NULL DEFAULT 0")
+    conn.execute("UPDATE chat_group SET used_at = strftime('%s', 'now')")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_chat_group_used ON chat_group (used_at)")
+
+
+MIGRATIONS: list[tuple[int, Callable[[sqlite3.Connection], None]]] = [
+    (1, _v1_base_schema),
+    (2, _v2_day_keys),
+    (3, _v3_telegram_files),
+    (4, _v4_user_preferences),
+    (5, _v5_chat_groups),
+    (6, _v6_subscriptions),
+    (7, _v7_chat_group_activity),
+]
+
+
+def schema_version(conn: sqlite3.Connection) -> int:
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def migrate(conn: sqlite3.Connection) -> int:
+    current = schema_version(conn)
+    for version, migration in MIGRATIONS:
+        if version <= current:
+            continue
+        log.info(f"Applying db migration {version}: {migration.__name__}")
+        if conn.in_transaction:
+            conn.commit()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            migration(conn)
+            conn.execute(f"PRAGMA user_version = {version}")
+            conn.commit()
+        except Exception as e:
+            conn.rollback()
+            log.error(f"Error db migration {version}: {e}")
+            raise
+        current = version
+    return current
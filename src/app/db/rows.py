@@ -0,0 +1,37 @@
+import sqlite3
+from itertools import groupby
+from typing import Iterable, NamedTuple
+
+import src.lib.date_utils as dutils
+
+
+class LessonRow(NamedTuple):
+    id: int
+    lesson_name: str
+    id_classroom: int | None
+    classroom: str | None
+    lesson_plan: int | None
+    start: int
+    end: int
+    date: str
+    flag_combine: int
+
+
+class ScheduleDay(NamedTuple):
+    date: str
+    title: str
+    lessons: tuple[LessonRow, ...]
+
+
+def lesson_row(cursor: sqlite3.Cursor, row: tuple) -> LessonRow:
+    return LessonRow._make(row)
+
+
+def group_days(rows: Iterable[LessonRow]) -> list[ScheduleDay]:
+    # Строки уже отсортированы по дню, заголовок дня форматируется один раз
+    return [ScheduleDay(date, dutils.day_title(date), tuple(lessons))
+            for date, lessons in groupby(rows, key=lambda row: row.date)]
+
+
+def count_lessons(days: Iterable[ScheduleDay]) -> int:
+    return sum(len(day.lessons) for day in days)
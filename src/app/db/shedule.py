@@ -1,13 +1,16 @@
-import sqlite3
-from datetime import datetime, timezone, timedelta
+import time
 from pathlib import Path
 from typing import List, Any
 
 import logging
-import arrow
 
 import src.config.config as config
-from src.api.schadule_client import Lesson
+from src.api.schadule_client import Lesson, GROUP_ID
+from src.app.db.connection import ConnectionManager
+from src.app.db.changes import ChangeSet
+from src.app.db.rows import ScheduleDay, group_days, lesson_row
+import src.app.db.migrations as migrations
+import src.lib.date_utils as dutils
 
 log: logging.Logger = logging.getLogger(__name__)
 
@@ -16,42 +19,110 @@ class ScheduleDb:
         self.cfg = cfg
         self.db_name: str = cfg.db_name
         self.DB_PATH = Path(cfg.storage_path)
+        self.DB_PATH.mkdir(parents=True, exist_ok=True)
+        self.pool = ConnectionManager(
+            self.DB_PATH / self.db_name,
+            cache_size_kb=cfg.db_cache_size_kb,
+            mmap_size=cfg.db_mmap_size,
+        )
         self.db_init()
         log.info("data base init")
 
-    def update_schedule(self, lessons: list[Lesson]):
-        conn = None
-        try:
-            conn = self.get_connection()
-            cursor = conn.cursor()
-            cursor.execute("DELETE FROM schedule")
-            conn.commit()
-        except Exception as e:
-            log.error(f"Error removed lessons all: {e}")
-        finally:
-            if conn:
-                conn.close()
+    def update_schedule(self, lessons: list[Lesson], group_id: int = GROUP_ID):
+        if not lessons:
+            return
+        # Заменяем только даты из ответа, архив остальных недель не трогаем
+        dates = [lesson.date for lesson in lessons]
+        self.ingest(lessons, min(dates), max(dates), group_id=group_id)
+
+    def ingest(self, lessons: list[Lesson], start: str | None = None, end: str | None = None,
+               group_id: int = GROUP_ID) -> int:
+        started = time.perf_counter()
+        with self.pool.write() as conn:
+            if start is None or end is None:
+                conn.execute("DELETE FROM schedule WHERE group_id = ?", (group_id,))
+            else:
+                conn.execute("DELETE FROM schedule WHERE group_id = ? AND day BETWEEN ? AND ?",
+                             (group_id, dutils.epoch_day(start), dutils.epoch_day(end)))
+            count = self._insert_lessons(conn, lessons, group_id)
+
+        log.info(f"Ingested {count} lessons in {(time.perf_counter() - started) * 1000:.1f} ms")
+        return count
+
+    def sync_schedule(self, lessons: list[Lesson], dates: set[str] | None = None,
+                      group_id: int = GROUP_ID) -> ChangeSet:
+        started = time.perf_counter()
+        fetched: dict[str, list[Lesson]] = {}
         for lesson in lessons:
-            subgroup = False if lesson.subgroup is None else True
-            self.add_lesson_in_schedule(
-                lesson_name=lesson.subject_title,
-                classroom_id=lesson.classroom_id,
-                classroom=lesson.classroom_title,
-                lesson_plan=lesson.sort,
-                start=lesson.start,
-                end=lesson.end,
-                data=lesson.date,
-                flag_combine=subgroup
-            )
+            fetched.setdefault(lesson.date, []).append(lesson)
+        dates = set(fetched) | set(dates or ())
+
+        changes = ChangeSet()
+        with self.pool.write() as conn:
+            stored = self.lessons_in_day(dates, group_id)
+            changes.initial = not stored
+            for date in sorted(dates):
+                old_lessons = stored.get(date, [])
+                new_lessons = fetched.get(date, [])
+                if not self._are_lessons_equal(old_lessons, new_lessons):
+                    changes.add_day(date, old_lessons, new_lessons)
+
+            if changes:
+                changed = sorted(changes.dates)
+                conn.executemany("DELETE FROM schedule WHERE group_id = ? AND day = ?",
+                                 [(group_id, dutils.epoch_day(date)) for date in changed])
+                self._insert_lessons(conn, [lesson for date in changed for lesson in fetched.get(date, [])], group_id)
+
+        log.info(f"Synced schedule group {group_id}: {changes} in {(time.perf_counter() - started) * 1000:.1f} ms")
+        return changes
+
+    def _insert_lessons(self, conn, lessons: list[Lesson], group_id: int = GROUP_ID) -> int:
+        if not lessons:
+            return 0
+        teachers = self._resolve_teachers(conn, lessons)
+        subjects = self._resolve_lessons(conn, lessons, teachers)
+
+        rows = []
+        for lesson in lessons:
+            day = dutils.epoch_day(lesson.date)
+            rows.append((subjects[lesson.subject_title], teachers.get(lesson.teacher_full), lesson.classroom_id,
+                         lesson.classroom_title, lesson.sort, lesson.start, lesson.end, lesson.date,
+                         lesson.subgroup is not None, group_id, day, dutils.week_of_day(day)))
+        conn.executemany("""INSERT INTO schedule 
+                            (id_lesson, id_teacher, id_classroom, classroom, lesson_plan, 
+                             start, end, date, flag_combine, group_id, day, week) 
+                            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""", rows)
+        return len(rows)
+
+    @staticmethod
+    def _resolve_teachers(conn, lessons: list[Lesson]) -> dict[str, int]:
+        teachers: dict[str, int] = {row[0]: row[1] for row in conn.execute("SELECT name, id FROM teacher")}
+        missing = {lesson.teacher_full: lesson.teacher_birthday
+                   for lesson in lessons if lesson.teacher_full not in teachers}
+        if missing:
+            log.info(f"Add new teachers: {list(missing)}")
+            conn.executemany("INSERT OR IGNORE INTO teacher (name, birthday) VALUES (?, ?)", missing.items())
+            teachers = {row[0]: row[1] for row in conn.execute("SELECT name, id FROM teacher")}
+        return teachers
 
-    def lessons_in_day(self, dates: set[str]) -> dict[str, list[Lesson]]:
-        conn = None
+    @staticmethod
+    def _resolve_lessons(conn, lessons: list[Lesson], teachers: dict[str, int]) -> dict[str, int]:
+        subjects: dict[str, int] = {row[0]: row[1] for row in conn.execute("SELECT name, id FROM lesson")}
+        missing = {lesson.subject_title: (teachers[lesson.teacher_full], lesson.subject_title, lesson.short_subject_title)
+                   for lesson in lessons if lesson.subject_title not in subjects}
+        if missing:
+            log.info(f"Add new lessons: {list(missing)}")
+            conn.executemany("INSERT OR IGNORE INTO lesson (id_teacher, name, short) VALUES (?, ?, ?)",
+                             missing.values())
+            subjects = {row[0]: row[1] for row in conn.execute("SELECT name, id FROM lesson")}
+        return subjects
+
+    def lessons_in_day(self, dates: set[str], group_id: int = GROUP_ID) -> dict[str, list[Lesson]]:
         lessons_by_date: dict[str, list[Lesson]] = {}
+        if not dates:
+            return lessons_by_date
 
         try:
-            conn = self.get_connection()
-            cursor = conn.cursor()
-
             placeholders = ','.join(['?' for _ in dates])
             query = f"""
                 SELECT 
@@ -68,13 +139,14 @@ class ScheduleDb:
                     t.birthday as teacher_birthday
                 FROM schedule s
                 JOIN lesson l ON s.id_lesson = l.id
-                JOIN teacher t ON t.id = l.id_teacher
-                WHERE s.date IN ({placeholders})
-                ORDER BY s.date, s.start
+                JOIN teacher t ON t.id = COALESCE(s.id_teacher, l.id_teacher)
+                WHERE s.group_id = ? AND s.day IN ({placeholders})
+                ORDER BY s.day, s.start
             """
 
-            cursor.execute(query, tuple(dates))
-            db_lessons = [dict(row) for row in cursor.fetchall()]
+            params = (group_id, *(dutils.epoch_day(date) for date in dates))
+            with self.pool.read() as conn:
+                db_lessons = [dict(row) for row in conn.execute(query, params).fetchall()]
 
             for db_lesson in db_lessons:
                 date = db_lesson["date"]
@@ -83,7 +155,7 @@ class ScheduleDb:
                     sort=db_lesson["lesson_plan"],
                     classroom_id=db_lesson["id_classroom"],
                     classroom_title=db_lesson["classroom"],
-                    subgroup=db_lesson["flag_combine"],
+                    subgroup=True if db_lesson["flag_combine"] else None,
                     start=db_lesson["start"],
                     end=db_lesson["end"],
                     teacher_full=db_lesson["teacher_name"],
@@ -99,9 +171,6 @@ class ScheduleDb:
         except Exception as e:
             log.error(f"Error get lessons {e}")
             return {}
-        finally:
-            if conn:
-                conn.close()
 
         return lessons_by_date
 
@@ -119,211 +188,111 @@ class ScheduleDb:
                     old_lesson.classroom_title != new_lesson.classroom_title or
                     old_lesson.start != new_lesson.start or
                     old_lesson.end != new_lesson.end or
-                    old_lesson.subgroup != new_lesson.subgroup):
+                    (old_lesson.subgroup is None) != (new_lesson.subgroup is None)):
                 return False
 
         return True
 
-    def _remove_lessons_by_date(self, date: str) -> None:
-        conn = None
+    def _remove_lessons_by_date(self, date: str, group_id: int = GROUP_ID) -> None:
         try:
-            conn = self.get_connection()
-            cursor = conn.cursor()
-            cursor.execute("DELETE FROM schedule WHERE date = ?", (date,))
-            conn.commit()
+            with self.pool.write() as conn:
+                conn.execute("DELETE FROM schedule WHERE group_id = ? AND day = ?",
+                             (group_id, dutils.epoch_day(date)))
         except Exception as e:
             log.error(f"Error removed lessons on the date: {date}, {e} ")
-        finally:
-            if conn:
-                conn.close()
 
-    def add_cascade(self, lessons: List[Lesson]):
+    def add_cascade(self, lessons: List[Lesson], group_id: int = GROUP_ID):
         log.info("Starting cascade add lessons in db")
-        lessons_name = self.get_lessons_name()
-        for lesson in lessons:
-            log.info(f"lessons adding: {lesson}")
-            if lesson.subject_title not in lessons_name:
-                log.warning(f"lesson {lesson.subject_title} not founded in db")
-                lessons_name.append(lesson.subject_title)
-                self.add_teacher(lesson.teacher_full, lesson.teacher_birthday)
-                self.add_lesson(lesson.teacher_full, lesson.subject_title, lesson.short_subject_title)
-
-            flag_combine = False
-            if lesson.subgroup is not None:
-                log.info(f"in {lesson.subject_title} will combined lesson")
-                flag_combine = True
-            self.add_lesson_in_schedule(
-                lesson.subject_title,
-                lesson.classroom_id,
-                lesson.classroom_title,
-                lesson.sort,
-                lesson.start,
-                lesson.end,
-                lesson.date,
-                flag_combine
-            )
+        # Через общий путь вставки: учителя, предметы и ключи группы/дня/недели
+        with self.pool.write() as conn:
+            self._insert_lessons(conn, lessons, group_id)
 
     def remove_lesson_in_schedule(self, id: int):
-        conn = None
         log.info(f"Remove lesson witch id: {id}")
         try:
-            conn = self.get_connection()
-            cursor = conn.cursor()
-            cursor.execute("""
-                DELETE FROM schedule WHERE id = ?
-            """, (id,))
-            conn.commit()
+            with self.pool.write() as conn:
+                conn.execute("""
+                    DELETE FROM schedule WHERE id = ?
+                """, (id,))
         except Exception as e:
             log.error(f"Error deleted lesson in table schedule {e}")
-            conn.rollback()
-        finally:
-            conn.close()
 
-    def get_connection(self) -> sqlite3.Connection:
-        log.info("Creating connection")
-        conn = sqlite3.connect(self.DB_PATH/self.db_name)
-        conn.row_factory = sqlite3.Row
-        return conn
+    def close(self) -> None:
+        self.pool.close()
 
     def db_init(self) -> None:
         log.info(f"Starting init db: {self.DB_PATH/self.db_name}")
-        conn = None
         try:
-            self.DB_PATH.mkdir(parents=True, exist_ok=True)
-            conn = self.get_connection()
-            cursor = conn.cursor()
-            cursor.executescript("""
-                CREATE TABLE IF NOT EXISTS teacher (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    name TEXT UNIQUE NOT NULL,
-                    birthday INTEGER
-                );
-
-                CREATE TABLE IF NOT EXISTS lesson (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    id_teacher INTEGER NOT NULL,
-                    name TEXT UNIQUE NOT NULL,
-                    short TEXT,
-                    FOREIGN KEY (id_teacher) REFERENCES teacher(id)
-                );
-
-                CREATE TABLE IF NOT EXISTS schedule (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    id_lesson INTEGER NOT NULL,
-                    id_classroom INTEGER NOT NULL,
-                    classroom TEXT NOT NULL,
-                    lesson_plan INTEGER NOT NULL,
-                    start INTEGER NOT NULL,
-                    end INTEGER NOT NULL,
-                    date TEXT NOT NULL,
-                    flag_combine BOOL DEFAULT 0,
-                    FOREIGN KEY (id_lesson) REFERENCES lesson(id)
-                );
-            """)
-            conn.commit()
-            log.info("Data base created")
-            cursor.execute("SELECT name FROM sqlite_master WHERE type='table'")
-            tables = [row['name'] for row in cursor.fetchall()]
-            log.info(f"Created tables: {tables}")
+            with self.pool.write() as conn:
+                version = migrations.migrate(conn)
+                tables = [row['name'] for row in conn.execute("SELECT name FROM sqlite_master WHERE type='table'")]
+                log.info(f"Data base schema version {version}, tables: {tables}")
         except Exception as e:
             log.error(f"Error init DB: {e}")
             raise
-        finally:
-            if conn:
-                conn.close()
 
     def add_lesson(self, teacher_name: str, lesson_name: str, short: str | None) -> None:
-        conn = None
         log.info(f"Add new lesson {lesson_name}")
         try:
-            conn = self.get_connection()
-            cursor = conn.cursor()
-
-            cursor.execute("SELECT id FROM teacher WHERE name = ?", (teacher_name,))
-            result = cursor.fetchone()
-            if not result:
-                log.warning(f"Teacher {teacher_name} not found")
-                raise ValueError(f"Teacher {teacher_name} not found")
-            teacher_id = result[0]
-
-            cursor.execute(
-                "INSERT INTO lesson (id_teacher, name, short) VALUES (?, ?, ?)",
-                (teacher_id, lesson_name, short)
-            )
-            conn.commit()
+            with self.pool.write() as conn:
+                result = conn.execute("SELECT id FROM teacher WHERE name = ?", (teacher_name,)).fetchone()
+                if not result:
+                    log.warning(f"Teacher {teacher_name} not found")
+                    raise ValueError(f"Teacher {teacher_name} not found")
+                teacher_id = result[0]
+
+                conn.execute(
+                    "INSERT INTO lesson (id_teacher, name, short) VALUES (?, ?, ?)",
+                    (teacher_id, lesson_name, short)
+                )
         except Exception as e:
             log.error(f"Error adding new lesson: {e}")
-            conn.rollback()
-        finally:
-            if conn:
-                conn.close()
 
 
     def add_teacher(self, name: str, birthday: int | None = None) -> None:
-        conn = None
         try:
-            conn = self.get_connection()
-            cursor = conn.cursor()
-
-            cursor.execute(
-                """INSERT OR IGNORE INTO teacher (name, birthday) 
-                   VALUES (?, ?)""",
-                (name, birthday)
-            )
-            log.info(f"Add new teacher: {name} witch birthday in {birthday}")
-            conn.commit()
+            with self.pool.write() as conn:
+                conn.execute(
+                    """INSERT OR IGNORE INTO teacher (name, birthday) 
+                       VALUES (?, ?)""",
+                    (name, birthday)
+                )
+                log.info(f"Add new teacher: {name} witch birthday in {birthday}")
         except Exception as e:
             log.error(f"Error added new teacher: {e}")
-            conn.rollback()
             raise
         finally:
-            if conn:
-                conn.close()
             log.info("New teacher added")
 
-    def add_lesson_in_schedule(self, lesson_name: str, classroom_id: int, classroom: str, lesson_plan: int, start: int, end: int, data: str, flag_combine: bool) -> None:
-        conn = None
+    def add_lesson_in_schedule(self, lesson_name: str, classroom_id: int, classroom: str, lesson_plan: int, start: int, end: int, data: str, flag_combine: bool,
+                               group_id: int = GROUP_ID) -> None:
         try:
-            log.info(f"add new lesson {lesson_name} in schedule")
-            conn = self.get_connection()
-            cursor = conn.cursor()
-            cursor.execute(
-                " SELECT id FROM lesson WHERE name = ? ",  (lesson_name,)
-            )
-            result = cursor.fetchone()
-            if not result:
-                log.warning(f"Lesson {lesson_name} not found")
-                raise ValueError(f"Lesson {lesson_name} not found")
-            lesson_id: int = result[0]
-            cursor.execute("""INSERT OR IGNORE INTO schedule 
-                              (id_lesson, id_classroom, classroom, lesson_plan, 
-                               start, end, date, flag_combine) 
-                              VALUES (?, ?, ?, ?, ?, ?, ?, ?)""",
-                           (lesson_id, classroom_id, classroom, lesson_plan,
-                            start, end, data, flag_combine))
-            conn.commit()
+            log.debug(f"add new lesson {lesson_name} in schedule")
+            with self.pool.write() as conn:
+                result = conn.execute(
+                    " SELECT id, id_teacher FROM lesson WHERE name = ? ",  (lesson_name,)
+                ).fetchone()
+                if not result:
+                    log.warning(f"Lesson {lesson_name} not found")
+                    raise ValueError(f"Lesson {lesson_name} not found")
+                lesson_id: int = result[0]
+                day = dutils.epoch_day(data)
+                conn.execute("""INSERT OR IGNORE INTO schedule 
+                                (id_lesson, id_teacher, id_classroom, classroom, lesson_plan, 
+                                 start, end, date, flag_combine, group_id, day, week) 
+                                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+                             (lesson_id, result[1], classroom_id, classroom, lesson_plan,
+                              start, end, data, flag_combine, group_id, day, dutils.week_of_day(day)))
         except Exception as e:
             log.error(f"Error added new lesson in schedule: {e}")
-            conn.rollback()
-        finally:
-            if conn:
-                conn.close()
-
-    def get_schedule(self, data: int):
-        conn = None
-        try:
-            gmt7 = timezone(timedelta(hours=7))
 
-            start: int = int(arrow.get(data).floor('week').timestamp())
-            end: int =  int(arrow.get(data).floor('week').shift(days=6).timestamp())
-            log.info(f"unix time start: {start}, end: {end}")
-            log.info(f"Start reading schedule from db start date: {start}, end date: {end}")
-            start = datetime.fromtimestamp(start, tz=gmt7)
-            end = datetime.fromtimestamp(end, tz=gmt7)
+    def get_schedule(self, data: int, group_id: int = GROUP_ID) -> list[ScheduleDay]:
+        week = dutils.week_of_timestamp(data)
+        log.debug(f"Start reading schedule from db group: {group_id}, week: {dutils.day_to_iso(week)}")
 
-            conn = self.get_connection()
+        with self.pool.read() as conn:
             cursor = conn.cursor()
-            log.info(f"iso start: {start}, end: {end}")
+            cursor.row_factory = lesson_row
             cursor.execute(
                 """
                 SELECT 
@@ -338,39 +307,133 @@ class ScheduleDb:
                     s.flag_combine
                 FROM schedule s
                 JOIN lesson l ON s.id_lesson = l.id
-                WHERE s.date BETWEEN ? AND ?
-                ORDER BY s.date, s.start
-                """, (start, end)
+                WHERE s.group_id = ? AND s.week = ?
+                ORDER BY s.day, s.start
+                """, (group_id, week)
             )
-            return [dict(row) for row in cursor.fetchall()]
-        finally:
-            if conn:
-                conn.close()
+            return group_days(cursor)
 
     def get_teacher_name(self) -> list[str]:
-        conn = None
-        log.info("Reading all teachers name")
-        try:
-            conn = self.get_connection()
-            cursor = conn.cursor()
-            cursor.execute("""
+        log.debug("Reading all teachers name")
+        with self.pool.read() as conn:
+            cursor = conn.execute("""
                 SELECT name FROM teacher
             """)
             return [row[0] for row in cursor.fetchall()]
-        finally:
-            if conn:
-                conn.close()
 
     def get_lessons_name(self) -> list[str]:
-        log.info("Reading all lessons name")
-        conn = None
-        try:
-            conn = self.get_connection()
-            cursor = conn.cursor()
-            cursor.execute("""
+        log.debug("Reading all lessons name")
+        with self.pool.read() as conn:
+            cursor = conn.execute("""
                 SELECT name FROM lesson
             """)
             return [row[0] for row in cursor.fetchall()]
-        finally:
-            if conn:
-                conn.close()
\ No newline at end of file
+
+    def get_file_id(self, content_hash: str) -> str | None:
+        with self.pool.read() as conn:
+            row = conn.execute("SELECT file_id FROM tg_file WHERE hash = ?", (content_hash,)).fetchone()
+            return row[0] if row else None
+
+    def save_file_id(self, content_hash: str, file_id: str, group_id: int, week: int) -> None:
+        try:
+            with self.pool.write() as conn:
+                # Старые картинки этой недели больше не актуальны
+                conn.execute("DELETE FROM tg_file WHERE group_id = ? AND week = ? AND hash != ?",
+                             (group_id, week, content_hash))
+                conn.execute("""INSERT OR REPLACE INTO tg_file (hash, file_id, group_id, week, created_at)
+                                VALUES (?, ?, ?, ?, ?)""",
+                             (content_hash, file_id, group_id, week, int(time.time())))
+        except Exception as e:
+            log.error(f"Error saving telegram file id: {e}")
+
+    def forget_file_id(self, content_hash: str) -> None:
+        try:
+            with self.pool.write() as conn:
+                conn.execute("DELETE FROM tg_file WHERE hash = ?", (content_hash,))
+        except Exception as e:
+            log.error(f"Error removing telegram file id: {e}")
+
+    def forget_week_files(self, group_id: int, week: int) -> None:
+        try:
+            with self.pool.write() as conn:
+                conn.execute("DELETE FROM tg_file WHERE group_id = ? AND week = ?", (group_id, week))
+        except Exception as e:
+            log.error(f"Error removing telegram file ids for week {week}: {e}")
+
+    def get_user_views(self) -> dict[int, str]:
+        with self.pool.read() as conn:
+            return {row[0]: row[1] for row in conn.execute("SELECT chat_id, view FROM user_pref")}
+
+    def set_user_view(self, chat_id: int, view: str) -> None:
+        try:
+            with self.pool.write() as conn:
+                conn.execute("INSERT OR REPLACE INTO user_pref (chat_id, view) VALUES (?, ?)", (chat_id, view))
+        except Exception as e:
+            log.error(f"Error saving view for chat {chat_id}: {e}")
+
+    def get_chat_groups(self) -> dict[int, int]:
+        with self.pool.read() as conn:
+            return {row[0]: row[1] for row in conn.execute("SELECT chat_id, group_id FROM chat_group")}
+
+    def set_chat_group(self, chat_id: int, group_id: int) -> None:
+        try:
+            with self.pool.write() as conn:
+                conn.execute("INSERT OR REPLACE INTO chat_group (chat_id, group_id, used_at) VALUES (?, ?, ?)",
+                             (chat_id, group_id, int(time.time())))
+        except Exception as e:
+            log.error(f"Error saving group for chat {chat_id}: {e}")
+
+    def touch_chat_group(self, chat_id: int) -> None:
+        try:
+            with self.pool.write() as conn:
+                conn.execute("UPDATE chat_group SET used_at = ? WHERE chat_id = ?", (int(time.time()), chat_id))
+        except Exception as e:
+            log.error(f"Error updating group activity for chat {chat_id}: {e}")
+
+    def active_groups(self, used_since: int = 0) -> set[int]:
+        with self.pool.read() as conn:
+            return {row[0] for row in conn.execute("SELECT DISTINCT group_id FROM chat_group WHERE used_at >= ?",
+                                                   (used_since,))}
+
+    def subscribe(self, chat_id: int) -> bool:
+        with self.pool.write() as conn:
+            return conn.execute("INSERT OR IGNORE INTO subscription (chat_id) VALUES (?)",
+                                (chat_id,)).rowcount > 0
+
+    def unsubscribe(self, chat_id: int) -> bool:
+        with self.pool.write() as conn:
+            return conn.execute("DELETE FROM subscription WHERE chat_id = ?", (chat_id,)).rowcount > 0
+
+    def subscribers(self, group_id: int, default_group: int) -> list[int]:
+        # Чаты без выбранной группы смотрят группу по умолчанию
+        with self.pool.read() as conn:
+            return [row[0] for row in conn.execute("""
+                SELECT s.chat_id
+                FROM subscription s
+                LEFT JOIN chat_group g ON g.chat_id = s.chat_id
+                WHERE COALESCE(g.group_id, ?) = ?
+            """, (default_group, group_id))]
+
+    def prune_weeks(self, before_week: int) -> int:
+        try:
+            with self.pool.write() as conn:
+                removed = conn.execute("DELETE FROM schedule WHERE week < ?", (before_week,)).rowcount
+                conn.execute("DELETE FROM tg_file WHERE week < ?", (before_week,))
+        except Exception as e:
+            log.error(f"Error pruning weeks before {before_week}: {e}")
+            return 0
+        if removed:
+            log.info(f"Pruned {removed} lessons before {dutils.day_to_iso(before_week)}")
+        return removed
+
+    def compact(self) -> None:
+        started = time.perf_counter()
+        try:
+            with self.pool.write() as conn:
+                conn.execute("PRAGMA optimize")
+                conn.execute("VACUUM")
+                conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        except Exception as e:
+            log.error(f"Error compacting db: {e}")
+            return
+        log.info(f"Data base compacted in {(time.perf_counter() - started) * 1000:.0f} ms")
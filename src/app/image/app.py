@@ -1,265 +1,417 @@
-from datetime import datetime
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
 from io import BytesIO
-from PIL import Image, ImageDraw, ImageFont
+from pathlib import Path
+from typing import Callable
+from PIL import Image, ImageDraw
 import textwrap
 
+import src.app.image.assets as assets
+import src.app.image.encoders as encoders
+from src.app.db.rows import ScheduleDay, count_lessons
+
+import logging
+
+log: logging.Logger = logging.getLogger(__name__)
+
 def minutes_to_time(minutes: int) -> str:
     hours = minutes // 60
     mins = minutes % 60
     return f"{hours:02d}:{mins:02d}"
 
 
-def format_date(timestamp_or_str) -> str:
-    if isinstance(timestamp_or_str, (int, float)):
-        date_obj = datetime.fromtimestamp(timestamp_or_str)
-    elif isinstance(timestamp_or_str, str):
-        try:
-            date_obj = datetime.fromisoformat(timestamp_or_str)
-        except ValueError:
-            try:
-                date_obj = datetime.strptime(timestamp_or_str, "%Y-%m-%d")
-            except ValueError:
-                date_obj = datetime.strptime(timestamp_or_str, "%Y-%m-%d %H:%M:%S")
-    else:
-        date_obj = timestamp_or_str
-
-    weekdays = {
-        'Monday': 'Понедельник',
-        'Tuesday': 'Вторник',
-        'Wednesday': 'Среда',
-        'Thursday': 'Четверг',
-        'Friday': 'Пятница',
-        'Saturday': 'Суббота',
-        'Sunday': 'Воскресенье'
-    }
-
-    weekday_english = date_obj.strftime("%A")
-    weekday_russian = weekdays.get(weekday_english, weekday_english)
-
-    return f"{date_obj.strftime('%d.%m.%Y')} ({weekday_russian})"
-
-
-def generate_schedule_image(schedule_data: list) -> BytesIO:
-    if not schedule_data:
-        img = Image.new('RGB', (1200, 300), color='#F8F9FA')
-        draw = ImageDraw.Draw(img)
+HEADER_HEIGHT = 80
+DAY_HEADER_HEIGHT = 70
+LESSON_HEIGHT = 120
+DAY_SPACING = 30
+PADDING = 60
+IMG_WIDTH = 1400
+CARD_RADIUS = 15
+SHADOW_OFFSET = 2
+TIME_BG_WIDTH = 220
+
+COLORS = {
+    'background': '#F8F9FA',
+    'header': '#2C3E50',
+    'day_header': '#34495E',
+    'card_bg': '#FFFFFF',
+    'card_shadow': '#E9ECEF',
+    'time_badge': '#3498DB',
+    'subject_text': '#2C3E50',
+    'info_text': '#7F8C8D',
+    'border': '#E0E0E0',
+    'combine_badge': '#E74C3C',
+    'lesson_type_badge': '#2ECC71'
+}
+
+FONTS = {
+    'title': ('bold', 42),
+    'day': ('bold', 32),
+    'subject': ('bold', 26),
+    'time': ('regular', 24),
+    'info': ('regular', 22),
+    'badge': ('regular', 20),
+    'empty': ('regular', 36),
+    'empty_small': ('regular', 24),
+}
+
+COMBINE_TEXT = "Объединенная группа"
+
+
+def _font(name: str):
+    style, size = FONTS[name]
+    return assets.get_assets().font(style, size)
+
+
+def preload_assets() -> None:
+    assets.get_assets().preload(list(FONTS.values()))
+
+
+def _build_empty() -> Image.Image:
+    img = Image.new('RGB', (1200, 300), color='#F8F9FA')
+    draw = ImageDraw.Draw(img)
 
-        try:
-            font = ImageFont.truetype("/usr/share/fonts/TTF/DejaVuSans.ttf", 36)
-            font_small = ImageFont.truetype("/usr/share/fonts/TTF/DejaVuSans.ttf", 24)
-        except:
-            font = ImageFont.load_default()
-            font_small = ImageFont.load_default()
-
-        draw.ellipse((500, 50, 700, 250), outline='#6C757D', width=3)
-        draw.rectangle((520, 70, 680, 120), fill='#6C757D', outline='#6C757D')
-        draw.text((600, 150), "Календарь", fill='#6C757D', font=font, anchor='mm')
-
-        draw.text((600, 230), "Расписание отсутствует",
-                  fill='#495057', font=font_small, anchor='mm')
-
-        img_bytes = BytesIO()
-        img.save(img_bytes, format='PNG')
-        img_bytes.seek(0)
-        return img_bytes
-
-    days = {}
-    for lesson in schedule_data:
-        if 'date' in lesson:
-            date_value = lesson['date']
-            if isinstance(date_value, (int, float)):
-                date_str = datetime.fromtimestamp(date_value).strftime('%Y-%m-%d')
-            else:
-                date_str = str(date_value).split()[0] if ' ' in str(date_value) else str(date_value)
-        else:
-            continue
-
-        if date_str not in days:
-            days[date_str] = []
-        days[date_str].append(lesson)
-
-    sorted_days = sorted(days.items())
-
-    HEADER_HEIGHT = 80
-    DAY_HEADER_HEIGHT = 70
-    LESSON_HEIGHT = 120
-    DAY_SPACING = 30
-    PADDING = 60
-    IMG_WIDTH = 1400
-    CARD_RADIUS = 15
-
-    COLORS = {
-        'background': '#F8F9FA',
-        'header': '#2C3E50',
-        'day_header': '#34495E',
-        'card_bg': '#FFFFFF',
-        'card_shadow': '#E9ECEF',
-        'time_badge': '#3498DB',
-        'subject_text': '#2C3E50',
-        'info_text': '#7F8C8D',
-        'border': '#E0E0E0',
-        'combine_badge': '#E74C3C',
-        'lesson_type_badge': '#2ECC71'
-    }
+    draw.ellipse((500, 50, 700, 250), outline='#6C757D', width=3)
+    draw.rectangle((520, 70, 680, 120), fill='#6C757D', outline='#6C757D')
+    draw.text((600, 150), "Календарь", fill='#6C757D', font=_font('empty'), anchor='mm')
+
+    draw.text((600, 230), "Расписание отсутствует",
+              fill='#495057', font=_font('empty_small'), anchor='mm')
+    return img
+
+
+def _build_header() -> Image.Image:
+    header = Image.new('RGB', (IMG_WIDTH, HEADER_HEIGHT), color=COLORS['header'])
+    ImageDraw.Draw(header).text((IMG_WIDTH // 2, HEADER_HEIGHT // 2),
+                                "РАСПИСАНИЕ ЗАНЯТИЙ",
+                                fill='white', font=_font('title'), anchor='mm')
+    return header
+
+
+def _build_day_header() -> Image.Image:
+    width = IMG_WIDTH - 2 * PADDING + 1
+    layer = Image.new('RGB', (width, DAY_HEADER_HEIGHT + 1), color=COLORS['background'])
+    ImageDraw.Draw(layer).rounded_rectangle(
+        [0, 0, width - 1, DAY_HEADER_HEIGHT],
+        radius=CARD_RADIUS,
+        fill=COLORS['day_header'],
+        outline=COLORS['day_header']
+    )
+    return layer
+
+
+def _build_card() -> Image.Image:
+    width = IMG_WIDTH - 2 * PADDING + SHADOW_OFFSET + 1
+    layer = Image.new('RGB', (width, LESSON_HEIGHT + SHADOW_OFFSET + 1), color=COLORS['background'])
+    draw = ImageDraw.Draw(layer)
+    draw.rounded_rectangle(
+        [SHADOW_OFFSET, SHADOW_OFFSET,
+         IMG_WIDTH - 2 * PADDING + SHADOW_OFFSET, LESSON_HEIGHT + SHADOW_OFFSET],
+        radius=CARD_RADIUS,
+        fill=COLORS['card_shadow'],
+        outline=COLORS['card_shadow']
+    )
+
+    draw.rounded_rectangle(
+        [0, 0, IMG_WIDTH - 2 * PADDING, LESSON_HEIGHT],
+        radius=CARD_RADIUS,
+        fill=COLORS['card_bg'],
+        outline=COLORS['border'],
+        width=2
+    )
+
+    draw.rounded_rectangle(
+        [20, 20, 20 + TIME_BG_WIDTH, LESSON_HEIGHT - 20],
+        radius=10,
+        fill=COLORS['time_badge'],
+        outline=COLORS['time_badge']
+    )
+    return layer
+
+
+def _build_badge(text: str, color: str) -> Image.Image:
+    font = _font('badge')
+    probe = ImageDraw.Draw(Image.new('RGB', (1, 1)))
+    text_bbox = probe.textbbox((0, 0), text, font=font)
+    width = text_bbox[2] - text_bbox[0] + 20
+
+    layer = Image.new('RGBA', (width + 1, 31), (0, 0, 0, 0))
+    draw = ImageDraw.Draw(layer)
+    draw.rounded_rectangle([0, 0, width, 30], radius=12, fill=color, outline=color)
+    draw.text((width // 2, 15), text, fill='white', font=font, anchor='mm')
+    return layer
+
+
+def _build_ellipses(boxes: list[tuple[tuple[int, int, int, int], str]]) -> Image.Image:
+    layer = Image.new('RGBA', (201, 201), (0, 0, 0, 0))
+    draw = ImageDraw.Draw(layer)
+    for box, color in boxes:
+        draw.ellipse(box, outline=color, width=1)
+    return layer
+
+
+def _layer(key: tuple, builder, *args) -> Image.Image:
+    return assets.get_assets().layer(key, lambda: builder(*args))
+
+
+class TileCache:
+    def __init__(self, capacity: int = 48):
+        self.capacity = capacity
+        self._items: OrderedDict[str, Image.Image] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Image.Image | None:
+        with self._lock:
+            tile = self._items.get(key)
+            if tile is not None:
+                self._items.move_to_end(key)
+            return tile
+
+    def put(self, key: str, tile: Image.Image) -> None:
+        with self._lock:
+            self._items[key] = tile
+            self._items.move_to_end(key)
+            while len(self._items) > self.capacity:
+                self._items.popitem(last=False)
+
+
+_tiles = TileCache()
+
+
+def configure_tiles(capacity: int) -> TileCache:
+    global _tiles
+    _tiles = TileCache(capacity)
+    return _tiles
+
+
+def _tile_height(lessons_count: int) -> int:
+    return DAY_HEADER_HEIGHT + 20 + lessons_count * (LESSON_HEIGHT + 15)
+
+
+def render_day_tile(day: ScheduleDay) -> Image.Image:
+    lessons = day.lessons
+    tile = Image.new('RGB', (IMG_WIDTH, _tile_height(len(lessons))), color=COLORS['background'])
+    draw = ImageDraw.Draw(tile)
+
+    day_font = _font('day')
+    subject_font = _font('subject')
+    time_font = _font('time')
+    info_font = _font('info')
+
+    tile.paste(_layer(('day_header',), _build_day_header), (PADDING, 0))
+
+    draw.text((PADDING + 80, DAY_HEADER_HEIGHT // 2),
+              day.title, fill='white', font=day_font, anchor='lm')
+
+    lessons_count = f"{len(lessons)} занятий"
+    text_bbox = draw.textbbox((0, 0), lessons_count, font=info_font)
+    text_width = text_bbox[2] - text_bbox[0]
+    draw.text((IMG_WIDTH - PADDING - 30 - text_width, DAY_HEADER_HEIGHT // 2),
+              lessons_count, fill='white', font=info_font, anchor='lm')
+
+    card = _layer(('card',), _build_card)
+    y_position = DAY_HEADER_HEIGHT + 20
+
+    for lesson in lessons:
+        tile.paste(card, (PADDING, y_position))
+
+        time_text = f"⏰ {minutes_to_time(lesson.start)} - {minutes_to_time(lesson.end)}"
+        time_lines = textwrap.wrap(time_text, width=15)
+        for j, line in enumerate(time_lines):
+            draw.text((PADDING + 20 + TIME_BG_WIDTH // 2,
+                       y_position + 40 + j * 30),
+                      line, fill='white', font=time_font, anchor='mm')
+
+        subject_x = PADDING + 20 + TIME_BG_WIDTH + 30
+
+        lesson_name = lesson.lesson_name or 'Без названия'
+        wrapped_subject = textwrap.wrap(lesson_name, width=35)
+        for j, line in enumerate(wrapped_subject[:2]):  # Максимум 2 строки
+            draw.text((subject_x, y_position + 30 + j * 35),
+                      line, fill=COLORS['subject_text'], font=subject_font)
+
+        classroom_y = y_position + 80
+        if len(wrapped_subject) > 1:
+            classroom_y += 15
+
+        classroom_text = f"Аудитория: {lesson.classroom or 'Не указана'}"
+        draw.text((subject_x, classroom_y),
+                  classroom_text, fill=COLORS['info_text'], font=info_font)
+
+        info_x = IMG_WIDTH - PADDING - 250
+
+        if lesson.lesson_plan:
+            plan_text = str(lesson.lesson_plan)
+            badge = _layer(('badge', plan_text), _build_badge, plan_text, COLORS['lesson_type_badge'])
+            tile.paste(badge, (info_x, y_position + 25), badge)
+
+        if lesson.flag_combine:
+            badge = _layer(('badge', COMBINE_TEXT), _build_badge, COMBINE_TEXT, COLORS['combine_badge'])
+            tile.paste(badge, (info_x, y_position + 65), badge)
+
+        y_position += LESSON_HEIGHT + 15
+
+    return tile
+
+
+def _day_tile(day: ScheduleDay) -> Image.Image:
+    key = schedule_hash([day])
+    tile = _tiles.get(key)
+    if tile is None:
+        tile = render_day_tile(day)
+        _tiles.put(key, tile)
+    return tile
+
+
+def generate_schedule_image(schedule_days: list[ScheduleDay], days: list[str] | None = None,
+                            profile: str = encoders.DEFAULT_PROFILE) -> BytesIO:
+    return BytesIO(render_schedule(schedule_days, days, profile).data)
+
+
+def render_schedule(schedule_days: list[ScheduleDay], days: list[str] | None = None,
+                    profile: str = encoders.DEFAULT_PROFILE) -> encoders.EncodeResult:
+    if days is not None:
+        schedule_days = [day for day in schedule_days if day.date in days]
+
+    if not schedule_days:
+        img = _layer(('empty',), _build_empty)
+
+        return encoders.encode(img, profile)
+
+    tiles = [_day_tile(day) for day in schedule_days]
+    lessons_total = count_lessons(schedule_days)
 
     total_height = PADDING * 2 + HEADER_HEIGHT + 40
 
-    for date_str, lessons in sorted_days:
+    for day in schedule_days:
         total_height += DAY_HEADER_HEIGHT + DAY_SPACING
-        total_height += len(lessons) * (LESSON_HEIGHT + 15)
+        total_height += len(day.lessons) * (LESSON_HEIGHT + 15)
 
     total_height += 40
 
     img = Image.new('RGB', (IMG_WIDTH, total_height), color=COLORS['background'])
     draw = ImageDraw.Draw(img)
 
-    try:
-        title_font = ImageFont.truetype("/usr/share/fonts/TTF/DejaVuSans-Bold.ttf", 42)
-        day_font = ImageFont.truetype("/usr/share/fonts/TTF/DejaVuSans-Bold.ttf", 32)
-        subject_font = ImageFont.truetype("/usr/share/fonts/TTF/DejaVuSans-Bold.ttf", 26)
-        time_font = ImageFont.truetype("/usr/share/fonts/TTF/DejaVuSans.ttf", 24)
-        info_font = ImageFont.truetype("/usr/share/fonts/TTF/DejaVuSans.ttf", 22)  # Исправлено опечатку
-        badge_font = ImageFont.truetype("/usr/share/fonts/TTF/DejaVuSans.ttf", 20)
-    except:
-        title_font = ImageFont.load_default()
-        day_font = ImageFont.load_default()
-        subject_font = ImageFont.load_default()
-        time_font = ImageFont.load_default()
-        info_font = ImageFont.load_default()
-        badge_font = ImageFont.load_default()
-
-    header_bg = Image.new('RGBA', (IMG_WIDTH, HEADER_HEIGHT), color=COLORS['header'])
-    img.paste(header_bg, (0, 0))
-
-    draw.text((IMG_WIDTH // 2, HEADER_HEIGHT // 2),
-              "РАСПИСАНИЕ ЗАНЯТИЙ",
-              fill='white', font=title_font, anchor='mm')
+    img.paste(_layer(('header',), _build_header), (0, 0))
 
     y_position = HEADER_HEIGHT + PADDING
-
-    for date_str, lessons in sorted_days:
-        day_title = format_date(date_str)
-
-        draw.rounded_rectangle(
-            [PADDING, y_position, IMG_WIDTH - PADDING, y_position + DAY_HEADER_HEIGHT],
-            radius=CARD_RADIUS,
-            fill=COLORS['day_header'],
-            outline=COLORS['day_header']
-        )
-
-        day_icon = ""
-        draw.text((PADDING + 30, y_position + DAY_HEADER_HEIGHT // 2),
-                  day_icon, fill='white', font=day_font, anchor='lm')
-
-        draw.text((PADDING + 80, y_position + DAY_HEADER_HEIGHT // 2),
-                  day_title, fill='white', font=day_font, anchor='lm')
-
-        lessons_count = f"{len(lessons)} занятий"
-        text_bbox = draw.textbbox((0, 0), lessons_count, font=info_font)
-        text_width = text_bbox[2] - text_bbox[0]
-        draw.text((IMG_WIDTH - PADDING - 30 - text_width, y_position + DAY_HEADER_HEIGHT // 2),
-                  lessons_count, fill='white', font=info_font, anchor='lm')
-
-        y_position += DAY_HEADER_HEIGHT + 20
-
-        for i, lesson in enumerate(lessons):
-            shadow_offset = 2
-            draw.rounded_rectangle(
-                [PADDING + shadow_offset, y_position + shadow_offset,
-                 IMG_WIDTH - PADDING + shadow_offset, y_position + LESSON_HEIGHT + shadow_offset],
-                radius=CARD_RADIUS,
-                fill=COLORS['card_shadow'],
-                outline=COLORS['card_shadow']
-            )
-
-            draw.rounded_rectangle(
-                [PADDING, y_position, IMG_WIDTH - PADDING, y_position + LESSON_HEIGHT],
-                radius=CARD_RADIUS,
-                fill=COLORS['card_bg'],
-                outline=COLORS['border'],
-                width=2
-            )
-
-            time_bg_width = 220
-            draw.rounded_rectangle(
-                [PADDING + 20, y_position + 20,
-                 PADDING + 20 + time_bg_width, y_position + LESSON_HEIGHT - 20],
-                radius=10,
-                fill=COLORS['time_badge'],
-                outline=COLORS['time_badge']
-            )
-
-            time_text = f"⏰ {minutes_to_time(lesson['start'])} - {minutes_to_time(lesson['end'])}"
-            time_lines = textwrap.wrap(time_text, width=15)
-            for j, line in enumerate(time_lines):
-                draw.text((PADDING + 20 + time_bg_width // 2,
-                           y_position + 40 + j * 30),
-                          line, fill='white', font=time_font, anchor='mm')
-
-            subject_x = PADDING + 20 + time_bg_width + 30
-
-            lesson_name = lesson.get('lesson_name', 'Без названия')
-            wrapped_subject = textwrap.wrap(lesson_name, width=35)
-            for j, line in enumerate(wrapped_subject[:2]):  # Максимум 2 строки
-                draw.text((subject_x, y_position + 30 + j * 35),
-                          line, fill=COLORS['subject_text'], font=subject_font)
-
-            classroom_y = y_position + 80
-            if len(wrapped_subject) > 1:
-                classroom_y += 15
-
-            classroom = lesson.get('classroom', 'Не указана')
-            classroom_text = f"Аудитория: {classroom}"
-            draw.text((subject_x, classroom_y),
-                      classroom_text, fill=COLORS['info_text'], font=info_font)
-
-            info_x = IMG_WIDTH - PADDING - 250
-
-            lesson_plan = lesson.get('lesson_plan')
-            if lesson_plan:
-                plan_text = str(lesson_plan)
-                text_bbox = draw.textbbox((0, 0), plan_text, font=badge_font)
-                plan_bg_width = text_bbox[2] - text_bbox[0] + 20
-                draw.rounded_rectangle(
-                    [info_x, y_position + 25, info_x + plan_bg_width, y_position + 55],
-                    radius=12,
-                    fill=COLORS['lesson_type_badge'],
-                    outline=COLORS['lesson_type_badge']
-                )
-                draw.text((info_x + plan_bg_width // 2, y_position + 40),
-                          plan_text, fill='white', font=badge_font, anchor='mm')
-
-            if lesson.get('flag_combine'):
-                combine_text = "Объединенная группа"
-                text_bbox = draw.textbbox((0, 0), combine_text, font=badge_font)
-                text_width = text_bbox[2] - text_bbox[0] + 20
-
-                draw.rounded_rectangle(
-                    [info_x, y_position + 65, info_x + text_width, y_position + 95],
-                    radius=12,
-                    fill=COLORS['combine_badge'],
-                    outline=COLORS['combine_badge']
-                )
-                draw.text((info_x + text_width // 2, y_position + 80),
-                          combine_text, fill='white', font=badge_font, anchor='mm')
-
-            y_position += LESSON_HEIGHT + 15
-
-        y_position += DAY_SPACING
+    for tile in tiles:
+        img.paste(tile, (0, y_position))
+        y_position += tile.height + DAY_SPACING
 
     footer_y = total_height - 40
     draw.text((IMG_WIDTH // 2, footer_y),
-              f"Всего занятий: {len(schedule_data)} | Сгенерировано: {datetime.now().strftime('%d.%m.%Y %H:%M')}",
-              fill=COLORS['info_text'], font=info_font, anchor='mm')
-
-    draw.ellipse((100, 100, 300, 300), outline='#E3F2FD', width=1)
-    draw.ellipse((150, 150, 250, 250), outline='#F3E5F5', width=1)
-
-    draw.ellipse((IMG_WIDTH - 300, total_height - 300, IMG_WIDTH - 100, total_height - 100),
-                 outline='#FFF3E0', width=1)
-
-    img_bytes = BytesIO()
-    img.save(img_bytes, format='PNG', optimize=True, quality=95)
-    img_bytes.seek(0)
-
-    return img_bytes
+              f"Всего занятий: {lessons_total}",
+              fill=COLORS['info_text'], font=_font('info'), anchor='mm')
+
+    top_ellipses = _layer(('ellipses', 'top'), _build_ellipses,
+                          [((0, 0, 200, 200), '#E3F2FD'), ((50, 50, 150, 150), '#F3E5F5')])
+    img.paste(top_ellipses, (100, 100), top_ellipses)
+
+    bottom_ellipse = _layer(('ellipses', 'bottom'), _build_ellipses, [((0, 0, 200, 200), '#FFF3E0')])
+    img.paste(bottom_ellipse, (IMG_WIDTH - 300, total_height - 300), bottom_ellipse)
+
+    return encoders.encode(img, profile)
+
+
+# Меняется вместе с оформлением картинки, чтобы не отдавать закэшированные старые версии
+LAYOUT_VERSION = 2
+
+
+def schedule_hash(schedule_days: list[ScheduleDay], **options) -> str:
+    # id строки не влияет на картинку
+    rows = [[day.date, [lesson[1:] for lesson in day.lessons]] for day in schedule_days]
+    payload = json.dumps([LAYOUT_VERSION, rows, options], sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class RenderCache:
+    def __init__(self, capacity: int = 32, disk_path: Path | None = None, disk_capacity: int = 256,
+                 renderer: Callable[..., encoders.EncodeResult] | None = None):
+        self.capacity = capacity
+        self.renderer = renderer or render_schedule
+        self.disk_path = disk_path
+        self.disk_capacity = disk_capacity
+        self._items: OrderedDict[str, bytes] = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+        if self.disk_path is not None:
+            self.disk_path.mkdir(parents=True, exist_ok=True)
+
+    def get(self, key: str, suffix: str = '.png') -> bytes | None:
+        with self._lock:
+            data = self._items.get(key)
+            if data is not None:
+                self._items.move_to_end(key)
+                return data
+
+        data = self._read_disk(key, suffix)
+        if data is not None:
+            self._put_memory(key, data)
+        return data
+
+    def put(self, key: str, data: bytes, suffix: str = '.png') -> None:
+        self._put_memory(key, data)
+        self._write_disk(key, data, suffix)
+
+    def render(self, schedule_days: list[ScheduleDay], **options) -> tuple[str, bytes]:
+        key = schedule_hash(schedule_days, **options)
+        suffix = encoders.suffix(options.get('profile', encoders.DEFAULT_PROFILE))
+        data = self.get(key, suffix)
+        if data is not None:
+            self.hits += 1
+            log.debug(f"Render cache hit {key[:12]}")
+            return key, data
+
+        self.misses += 1
+        # Кодирование может идти в процессе-воркере, поэтому статистику собираем здесь
+        result = self.renderer(schedule_days, **options)
+        encoders.stats.record(result)
+        self.put(key, result.data, suffix)
+        log.info(f"Render cache miss {key[:12]}, {result.profile}: {result.size} bytes "
+                 f"encoded in {result.seconds * 1000:.1f} ms")
+        return key, result.data
+
+    def _put_memory(self, key: str, data: bytes) -> None:
+        with self._lock:
+            self._items[key] = data
+            self._items.move_to_end(key)
+            while len(self._items) > self.capacity:
+                self._items.popitem(last=False)
+
+    def _disk_file(self, key: str, suffix: str) -> Path:
+        return self.disk_path / f"{key}{suffix}"
+
+    def _read_disk(self, key: str, suffix: str) -> bytes | None:
+        if self.disk_path is None:
+            return None
+        try:
+            return self._disk_file(key, suffix).read_bytes()
+        except FileNotFoundError:
+            return None
+        except OSError as e:
+            log.warning(f"Error reading render cache {key[:12]}: {e}")
+            return None
+
+    def _write_disk(self, key: str, data: bytes, suffix: str) -> None:
+        if self.disk_path is None:
+            return
+        path = self._disk_file(key, suffix)
+        tmp = path.with_suffix('.tmp')
+        try:
+            tmp.write_bytes(data)
+            os.replace(tmp, path)
+            self._prune_disk()
+        except OSError as e:
+            log.warning(f"Error writing render cache {key[:12]}: {e}")
+
+    def _prune_disk(self) -> None:
+        files = sorted((f for f in self.disk_path.iterdir() if f.suffix in encoders.SUFFIXES.values()),
+                       key=lambda f: f.stat().st_mtime)
+        for old in files[:max(0, len(files) - self.disk_capacity)]:
+            old.unlink(missing_ok=True)
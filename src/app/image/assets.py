@@ -0,0 +1,86 @@
+import threading
+from pathlib import Path
+from typing import Callable
+
+from PIL import Image, ImageFont
+
+import logging
+
+log: logging.Logger = logging.getLogger(__name__)
+
+DEFAULT_FONT_DIRS = ("/usr/share/fonts/TTF", "/usr/share/fonts/truetype/dejavu")
+
+FONT_FILES = {
+    'regular': "DejaVuSans.ttf",
+    'bold': "DejaVuSans-Bold.ttf",
+}
+
+
+class RenderAssets:
+    def __init__(self, font_dirs: tuple[str, ...] | list[str] = DEFAULT_FONT_DIRS,
+                 font_files: dict[str, str] | None = None):
+        self.font_dirs = [Path(d).expanduser() for d in font_dirs]
+        self.font_files = dict(FONT_FILES, **(font_files or {}))
+        self._fonts: dict[tuple[str, int], ImageFont.ImageFont | ImageFont.FreeTypeFont] = {}
+        self._layers: dict[tuple, Image.Image] = {}
+        self._lock = threading.RLock()
+
+    def _font_path(self, style: str) -> Path | None:
+        name = self.font_files[style]
+        if Path(name).is_absolute():
+            return Path(name)
+        for font_dir in self.font_dirs:
+            path = font_dir / name
+            if path.exists():
+                return path
+        return None
+
+    def font(self, style: str, size: int):
+        key = (style, size)
+        font = self._fonts.get(key)
+        if font is not None:
+            return font
+
+        with self._lock:
+            font = self._fonts.get(key)
+            if font is None:
+                path = self._font_path(style)
+                try:
+                    if path is None:
+                        raise OSError(f"font {self.font_files[style]} not found in {self.font_dirs}")
+                    font = ImageFont.truetype(str(path), size)
+                except OSError as e:
+                    log.warning(f"Error loading font {style} {size}: {e}, using default")
+                    font = ImageFont.load_default()
+                self._fonts[key] = font
+        return font
+
+    def layer(self, key: tuple, builder: Callable[[], Image.Image]) -> Image.Image:
+        image = self._layers.get(key)
+        if image is not None:
+            return image
+
+        with self._lock:
+            image = self._layers.get(key)
+            if image is None:
+                image = builder()
+                self._layers[key] = image
+        return image
+
+    def preload(self, fonts: list[tuple[str, int]]) -> "RenderAssets":
+        for style, size in fonts:
+            self.font(style, size)
+        return self
+
+
+_assets = RenderAssets()
+
+
+def configure(font_dirs: list[str] | None = None, font_files: dict[str, str] | None = None) -> RenderAssets:
+    global _assets
+    _assets = RenderAssets(font_dirs or DEFAULT_FONT_DIRS, font_files)
+    return _assets
+
+
+def get_assets() -> RenderAssets:
+    return _assets
@@ -0,0 +1,107 @@
+import threading
+import time
+from dataclasses import dataclass
+from io import BytesIO
+from typing import Callable
+
+from PIL import Image
+
+import logging
+
+log: logging.Logger = logging.getLogger(__name__)
+
+
+@dataclass
+class EncodeResult:
+    profile: str
+    format: str
+    data: bytes
+    seconds: float
+
+    @property
+    def size(self) -> int:
+        return len(self.data)
+
+
+def _png_optimized(img: Image.Image, buf: BytesIO) -> None:
+    img.save(buf, format='PNG', optimize=True)
+
+
+def _png_fast(img: Image.Image, buf: BytesIO) -> None:
+    img.save(buf, format='PNG', compress_level=1)
+
+
+def _png_palette(img: Image.Image, buf: BytesIO) -> None:
+    # Плоские цвета и сглаживание текста укладываются в 64 цвета палитры
+    palette = img.quantize(colors=64, method=Image.Quantize.FASTOCTREE, dither=Image.Dither.NONE)
+    palette.save(buf, format='PNG', compress_level=6)
+
+
+def _webp(img: Image.Image, buf: BytesIO) -> None:
+    img.save(buf, format='WEBP', quality=90, method=2)
+
+
+def _jpeg(img: Image.Image, buf: BytesIO) -> None:
+    img.save(buf, format='JPEG', quality=90, subsampling=0)
+
+
+PROFILES: dict[str, tuple[str, Callable[[Image.Image, BytesIO], None]]] = {
+    'png_optimized': ('PNG', _png_optimized),
+    'png_fast': ('PNG', _png_fast),
+    'png_palette': ('PNG', _png_palette),
+    'webp': ('WEBP', _webp),
+    'jpeg': ('JPEG', _jpeg),
+}
+
+DEFAULT_PROFILE = 'png_palette'
+
+SUFFIXES = {'PNG': '.png', 'WEBP': '.webp', 'JPEG': '.jpg'}
+
+
+def suffix(profile: str) -> str:
+    return SUFFIXES[PROFILES[profile][0]] if profile in PROFILES else '.png'
+
+
+class EncoderStats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats: dict[str, list[float]] = {}
+
+    def record(self, result: EncodeResult) -> None:
+        with self._lock:
+            count, seconds, size = self._stats.get(result.profile, [0, 0.0, 0])
+            self._stats[result.profile] = [count + 1, seconds + result.seconds, size + result.size]
+
+    def summary(self) -> dict[str, dict[str, float]]:
+        with self._lock:
+            return {
+                profile: {
+                    'count': count,
+                    'avg_ms': seconds / count * 1000,
+                    'avg_bytes': size / count,
+                }
+                for profile, (count, seconds, size) in self._stats.items()
+            }
+
+
+stats = EncoderStats()
+
+
+def check_profile(profile: str) -> str:
+    if profile not in PROFILES:
+        raise ValueError(f"Unknown encoder profile {profile}, expected one of {list(PROFILES)}")
+    return profile
+
+
+def encode(img: Image.Image, profile: str = DEFAULT_PROFILE) -> EncodeResult:
+    check_profile(profile)
+    image_format, encoder = PROFILES[profile]
+
+    started = time.perf_counter()
+    buf = BytesIO()
+    encoder(img, buf)
+    result = EncodeResult(profile, image_format, buf.getvalue(), time.perf_counter() - started)
+
+    log.debug(f"Encoded {img.size[0]}x{img.size[1]} with {profile}: "
+              f"{result.size} bytes in {result.seconds * 1000:.1f} ms")
+    return result
@@ -0,0 +1,77 @@
+import multiprocessing
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor
+
+import logging
+
+import src.app.image.app as image_gen
+import src.app.image.assets as assets
+from src.app.image.encoders import EncodeResult
+from src.app.db.rows import ScheduleDay
+
+log: logging.Logger = logging.getLogger(__name__)
+
+class RenderQueueFull(Exception):
+    pass
+
+
+def _init_worker(font_dirs: list[str], font_files: dict[str, str], tile_cache_size: int) -> None:
+    assets.configure(font_dirs, font_files)
+    image_gen.preload_assets()
+    image_gen.configure_tiles(tile_cache_size)
+
+
+def _warm_up() -> int:
+    return multiprocessing.current_process().pid
+
+
+def _render(schedule_days: list[ScheduleDay], options: dict) -> EncodeResult:
+    return image_gen.render_schedule(schedule_days, **options)
+
+
+class RenderService:
+    def __init__(self, workers: int, queue_size: int, queue_timeout: float,
+                 font_dirs: list[str], font_files: dict[str, str], tile_cache_size: int):
+        self.workers = workers
+        self.queue_size = queue_size
+        self.queue_timeout = queue_timeout
+        self._slots = threading.BoundedSemaphore(workers + queue_size)
+        self._executor = ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=_init_worker,
+            initargs=(font_dirs, font_files, tile_cache_size),
+        )
+        self.rendered = 0
+        self.rejected = 0
+
+    def start(self) -> "RenderService":
+        started = time.perf_counter()
+        pids = {future.result() for future in [self._executor.submit(_warm_up) for _ in range(self.workers)]}
+        log.info(f"Render service started: {len(pids)} workers, "
+                 f"warm up {(time.perf_counter() - started) * 1000:.0f} ms")
+        return self
+
+    def submit(self, schedule_days: list[ScheduleDay], **options) -> Future:
+        if not self._slots.acquire(timeout=self.queue_timeout):
+            self.rejected += 1
+            raise RenderQueueFull(f"render queue is full ({self.workers + self.queue_size} tasks)")
+        try:
+            # Строки - именованные кортежи, в воркер уходят без промежуточной упаковки
+            future = self._executor.submit(_render, schedule_days, options)
+        except BaseException:
+            self._slots.release()
+            raise
+        # Слот освобождается по окончании работы, а не когда вызывающий перестал ждать
+        future.add_done_callback(lambda _: self._slots.release())
+        return future
+
+    def render(self, schedule_days: list[ScheduleDay], **options) -> EncodeResult:
+        result = self.submit(schedule_days, **options).result()
+        self.rendered += 1
+        return result
+
+    def stop(self) -> None:
+        self._executor.shutdown(wait=True, cancel_futures=True)
+        log.info(f"Render service stopped, rendered: {self.rendered}, rejected: {self.rejected}")
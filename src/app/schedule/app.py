@@ -1,13 +1,21 @@
 import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
 import time
 import random
-from datetime import datetime, timedelta
-from typing import Optional
+from datetime import date, datetime, timedelta
+from typing import Callable, Optional
 
 from api.schadule_client import Lesson
+from src.api.resilience import CircuitOpen
+from src.app.db.changes import ChangeSet
+from src.app.db.rows import LessonRow, ScheduleDay, count_lessons
 from src.app.db.shedule import ScheduleDb
 import src.api.schadule_client as schedule_client
 import src.config.config as config
+from src.app.schedule.snapshot import SnapshotStore
+from src.lib.single_flight import SingleFlight
+import src.lib.date_utils as dutils
 import logging
 
 log: logging.Logger = logging.getLogger(__name__)
@@ -17,12 +25,302 @@ class Schedule:
     def __init__(self, cfg: config.Config):
         self.cfg = cfg
         self.data = ScheduleDb(cfg)
+        self.default_group: int = cfg.default_group
         self.need_update = datetime.now() + timedelta(minutes=self.cfg.schedule_update)
+
+        self._lock = threading.Lock()
+        self._snapshots: dict[tuple[int, int], tuple[int, list[ScheduleDay]]] = {}
+        self._version = 0
+        self._flight = SingleFlight()
+        self._fetcher = ThreadPoolExecutor(max_workers=cfg.fetch_concurrency, thread_name_prefix="schedule-fetch")
+        self.client = schedule_client.ScheduleClient(cfg.api_host, cfg.api_token, cfg.api_connect_timeout,
+                                                     cfg.api_read_timeout, cfg.fetch_concurrency,
+                                                     retries=cfg.api_retries, backoff_base=cfg.api_backoff_base,
+                                                     backoff_max=cfg.api_backoff_max, deadline=cfg.api_deadline,
+                                                     breaker_threshold=cfg.api_breaker_threshold,
+                                                     breaker_reset=cfg.api_breaker_reset)
+        self._started_at = datetime.now()
+        self._fresh_at: dict[tuple[int, int], datetime] = {}
+        self._listeners: list[Callable[[int, int, ChangeSet], None]] = []
+        self._refreshed_at: Optional[datetime] = None
+        self._last_error: Optional[Exception] = None
+        self._compacted_at = datetime.now()
+        self.snapshots = SnapshotStore(cfg.snapshot_path) if cfg.snapshot_path else None
+        self._stop = threading.Event()
+        self._worker: Optional[threading.Thread] = None
         log.info("Schedule class initialized")
 
-    def get(self):
-        if self.need_update < datetime.now():
-            new_lessons = schedule_client.parse_schedule(int(time.time()))
-            self.data.update_schedule(new_lessons)
-            self.need_update = datetime.now() + timedelta(minutes=self.cfg.schedule_update + random.randint(0, 30))
-        return self.data.get_schedule(int(time.time()))
+    def start(self):
+        if self._worker and self._worker.is_alive():
+            return self
+        self._stop.clear()
+        self.warm_start()
+        self._worker = threading.Thread(target=self._run, name="schedule-refresher", daemon=True)
+        self._worker.start()
+        log.info("Schedule refresher started")
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._worker:
+            self._worker.join(timeout=5)
+            self._worker = None
+        self._fetcher.shutdown(wait=False, cancel_futures=True)
+        self.client.close()
+        log.info("Schedule refresher stopped")
+
+    def _run(self):
+        while not self._stop.is_set():
+            # Ошибка одного прохода не должна останавливать поток обновления
+            try:
+                self.refresh_all()
+                self._maintain()
+            except Exception as e:
+                log.error(f"Error in schedule refresher: {e}", exc_info=True)
+                with self._lock:
+                    self._last_error = e
+            delay = self._next_delay()
+            self.need_update = datetime.now() + timedelta(seconds=delay)
+            log.info(f"Next schedule refresh at {self.need_update}")
+            self._stop.wait(delay)
+
+    def warm_start(self) -> int:
+        if self.snapshots is None:
+            return 0
+        started = time.perf_counter()
+        loaded = 0
+        for group_id in sorted(self.active_groups()):
+            for week in self.prefetch_weeks():
+                snapshot = self.snapshots.load(group_id, week)
+                if snapshot is None:
+                    continue
+                fetched_at, result = snapshot
+                try:
+                    days = self.data.get_schedule(dutils.week_timestamp(week), group_id)
+                    if not days:
+                        # База пустая или удалена: восстанавливаем неделю из снимка
+                        self.data.sync_schedule(result.lessons, set(dutils.week_dates(week)), group_id)
+                        days = self.data.get_schedule(dutils.week_timestamp(week), group_id)
+                except Exception as e:
+                    log.error(f"Error restoring snapshot group {group_id} week {dutils.day_to_iso(week)}: {e}")
+                    continue
+
+                self.client.prime(group_id, result.start, result.etag, result.last_modified, result.digest)
+                with self._lock:
+                    self._version += 1
+                    self._snapshots[(group_id, week)] = (self._version, days)
+                    refreshed_at = datetime.fromtimestamp(fetched_at)
+                    self._fresh_at[(group_id, week)] = refreshed_at
+                    if self._refreshed_at is None or refreshed_at < self._refreshed_at:
+                        self._refreshed_at = refreshed_at
+                loaded += 1
+        log.info(f"Warm start from {loaded} snapshots in {(time.perf_counter() - started) * 1000:.0f} ms")
+        return loaded
+
+    def add_listener(self, listener: Callable[[int, int, ChangeSet], None]) -> None:
+        self._listeners.append(listener)
+
+    def _notify(self, group_id: int, week: int, changes: ChangeSet) -> None:
+        changes = changes.since(date.today().isoformat())
+        if not changes or changes.initial:
+            return
+        for listener in self._listeners:
+            try:
+                listener(group_id, week, changes)
+            except Exception as e:
+                log.error(f"Error notifying schedule change group {group_id}: {e}", exc_info=True)
+
+    def _next_delay(self) -> float:
+        minutes = self.cfg.schedule_update + random.randint(0, self.cfg.schedule_jitter)
+        return minutes * 60
+
+    @staticmethod
+    def current_week() -> int:
+        return dutils.week_of_timestamp(time.time())
+
+    def prefetch_weeks(self) -> list[int]:
+        week = self.current_week()
+        return [week + 7 * offset for offset in range(-self.cfg.prefetch_behind, self.cfg.prefetch_ahead + 1)]
+
+    def active_groups(self) -> set[int]:
+        # Группы, которыми давно не пользовались, в фоне не обновляем
+        used_since = int(time.time()) - self.cfg.group_idle_days * 86400
+        return {self.default_group} | self.data.active_groups(used_since)
+
+    def load_group(self, group_id: int) -> bool | None:
+        # Проверка новой группы: True - есть занятия, False - группы нет, None - API недоступен
+        weeks = self.prefetch_weeks()
+        try:
+            fetched = self.client.fetch_many_sync([(dutils.week_timestamp(week), group_id) for week in weeks],
+                                                  self.cfg.fetch_concurrency)
+        except Exception as e:
+            log.warning(f"Error checking group {group_id}: {e}")
+            return None
+
+        results = [fetched[(dutils.week_timestamp(week), group_id)] for week in weeks]
+        if any(isinstance(result, schedule_client.ScheduleApiError) and result.status in (400, 404)
+               for result in results):
+            return False
+        if not any(not isinstance(result, Exception) and (result.lessons or result.not_modified)
+                   for result in results):
+            return None if any(isinstance(result, Exception) for result in results) else False
+
+        for week, result in zip(weeks, results):
+            self._flight.do(("refresh", group_id, week), self._apply, group_id, week, result)
+        return True
+
+    def refresh_all(self) -> dict[tuple[int, int], bool]:
+        requests = [(group_id, week) for group_id in sorted(self.active_groups()) for week in self.prefetch_weeks()]
+        started = time.perf_counter()
+        try:
+            fetched = self.client.fetch_many_sync(
+                [(dutils.week_timestamp(week), group_id) for group_id, week in requests],
+                self.cfg.fetch_concurrency,
+            )
+        except Exception as e:
+            fetched = {(dutils.week_timestamp(week), group_id): e for group_id, week in requests}
+
+        results = {}
+        for group_id, week in requests:
+            result = fetched[(dutils.week_timestamp(week), group_id)]
+            results[(group_id, week)] = self._flight.do(("refresh", group_id, week),
+                                                        self._apply, group_id, week, result)
+        log.info(f"Refreshed {len(requests)} group weeks in {time.perf_counter() - started:.2f} s, "
+                 f"failed: {[key for key, ok in results.items() if not ok]}")
+        return results
+
+    def refresh(self, group_id: int | None = None, week: int | None = None) -> bool:
+        group_id = group_id or self.default_group
+        week = self.current_week() if week is None else week
+        return self._flight.do(("refresh", group_id, week), self._refresh, group_id, week)
+
+    def refresh_async(self, group_id: int):
+        return self._fetcher.submit(self.refresh, group_id)
+
+    def _refresh(self, group_id: int, week: int) -> bool:
+        try:
+            result = self.client.fetch_sync(dutils.week_timestamp(week), group_id)
+        except Exception as e:
+            result = e
+        return self._apply(group_id, week, result)
+
+    def _apply(self, group_id: int, week: int, result: schedule_client.FetchResult | Exception) -> bool:
+        changes = None
+        try:
+            if isinstance(result, Exception):
+                raise result
+            snapshot = self._snapshots.get((group_id, week))
+            if result.not_modified and snapshot is not None:
+                log.info(f"Schedule group {group_id} week {dutils.day_to_iso(week)} unchanged")
+                self.client.commit(result)
+                with self._lock:
+                    self._refreshed_at = datetime.now()
+                    self._fresh_at[(group_id, week)] = self._refreshed_at
+                    self._last_error = None
+                return True
+
+            if not result.not_modified:
+                changes = self.data.sync_schedule(result.lessons, set(dutils.week_dates(week)), group_id)
+                if changes:
+                    self.data.forget_week_files(group_id, week)
+                if self.snapshots is not None:
+                    self.snapshots.save(result, week)
+            days = self.data.get_schedule(dutils.week_timestamp(week), group_id)
+            self.client.commit(result)
+        except CircuitOpen as e:
+            log.warning(f"Skip refresh group {group_id} week {dutils.day_to_iso(week)}: {e}")
+            with self._lock:
+                self._last_error = e
+            return False
+        except Exception as e:
+            log.error(f"Error refresh schedule group {group_id} week {dutils.day_to_iso(week)}: {e}",
+                      exc_info=True)
+            with self._lock:
+                self._last_error = e
+            return False
+
+        with self._lock:
+            snapshot = self._snapshots.get((group_id, week))
+            if changes or snapshot is None:
+                self._version += 1
+                version = self._version
+            else:
+                version = snapshot[0]
+            self._snapshots[(group_id, week)] = (version, days)
+            self._refreshed_at = datetime.now()
+            self._fresh_at[(group_id, week)] = self._refreshed_at
+            self._last_error = None
+        log.info(f"Schedule group {group_id} week {dutils.day_to_iso(week)} refreshed, lessons: {count_lessons(days)}")
+        if changes:
+            self._notify(group_id, week, changes)
+        return True
+
+    def _maintain(self) -> None:
+        oldest = self.current_week() - 7 * max(self.cfg.retention_weeks, self.cfg.prefetch_behind)
+        with self._lock:
+            for key in [key for key in self._snapshots if key[1] < oldest]:
+                del self._snapshots[key]
+                self._fresh_at.pop(key, None)
+        self.data.prune_weeks(oldest)
+        if self.snapshots is not None:
+            self.snapshots.prune(oldest)
+
+        if datetime.now() - self._compacted_at >= timedelta(hours=self.cfg.compact_interval_hours):
+            self.data.compact()
+            self._compacted_at = datetime.now()
+
+    def get(self, group_id: int | None = None, week_offset: int = 0):
+        return self.current(group_id, week_offset)[1]
+
+    def current(self, group_id: int | None = None, week_offset: int = 0) -> tuple[tuple, list[ScheduleDay]]:
+        group_id = group_id or self.default_group
+        week = self.current_week() + 7 * week_offset
+        return self.week(group_id, week)
+
+    def week(self, group_id: int, week: int) -> tuple[tuple, list[ScheduleDay]]:
+        snapshot = self._snapshots.get((group_id, week))
+        if snapshot is None:
+            # Недели вне окна предзагрузки и недели новой группы загружаем по запросу
+            self.refresh(group_id, week)
+            snapshot = self._snapshots.get((group_id, week))
+        if snapshot is not None:
+            return (group_id, week, snapshot[0]), snapshot[1]
+        key = ("read", group_id, week)
+        days = self._flight.do(key, self.data.get_schedule, dutils.week_timestamp(week), group_id)
+        return (group_id, week, 0), days
+
+    def lessons_on(self, day: date, group_id: int | None = None) -> list[LessonRow]:
+        date_str = day.isoformat()
+        week = dutils.week_of_day(dutils.epoch_day(day))
+        _, days = self.week(group_id or self.default_group, week)
+        for schedule_day in days:
+            if schedule_day.date == date_str:
+                return list(schedule_day.lessons)
+        return []
+
+    def upcoming(self, now: datetime, group_id: int | None = None, days: int = 7) -> list[LessonRow]:
+        lessons = []
+        for offset in range(days):
+            lessons.extend(self.lessons_on(now.date() + timedelta(days=offset), group_id))
+        return lessons
+
+    def stale_since(self, group_id: int, week: int) -> Optional[datetime]:
+        fresh_at = self._fresh_at.get((group_id, week))
+        breaker_open = self.client.breaker.is_open
+        if fresh_at is None:
+            # Неделя ни разу не обновлялась: данные из базы, не новее запуска бота
+            return self._started_at if breaker_open else None
+        limit = timedelta(minutes=self.cfg.schedule_update + self.cfg.schedule_jitter)
+        if breaker_open or datetime.now() - fresh_at > limit:
+            return fresh_at
+        return None
+
+    @property
+    def refresh_age(self) -> Optional[timedelta]:
+        if self._refreshed_at is None:
+            return None
+        return datetime.now() - self._refreshed_at
+
+    @property
+    def last_error(self) -> Optional[Exception]:
+        return self._last_error
@@ -0,0 +1,88 @@
+import json
+import mmap
+import os
+import struct
+import time
+from pathlib import Path
+
+import logging
+
+import src.api.schadule_client as schedule_client
+
+log: logging.Logger = logging.getLogger(__name__)
+
+MAGIC = b"USNP"
+FORMAT_VERSION = 1
+# magic, версия формата, группа, начало недели, время загрузки, длина метаданных
+HEADER = struct.Struct("<4sHiqdI")
+
+
+class SnapshotStore:
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self.path.mkdir(parents=True, exist_ok=True)
+
+    def _file(self, group_id: int, week: int) -> Path:
+        return self.path / f"{group_id}-{week}.snap"
+
+    def save(self, result: schedule_client.FetchResult, week: int) -> None:
+        # Неделю передает вызывающий: result.start - полночь UTC, по местному времени это может быть прошлая неделя
+        if result.raw is None or result.digest is None:
+            return
+        meta = json.dumps({
+            'encoding': result.encoding,
+            'etag': result.etag,
+            'last_modified': result.last_modified,
+            'digest': result.digest,
+        }).encode("utf-8")
+        header = HEADER.pack(MAGIC, FORMAT_VERSION, result.group_id, result.start, time.time(), len(meta))
+
+        path = self._file(result.group_id, week)
+        tmp = path.with_suffix(".tmp")
+        try:
+            with open(tmp, "wb") as f:
+                f.write(header)
+                f.write(meta)
+                f.write(result.raw)
+            os.replace(tmp, path)
+        except OSError as e:
+            log.warning(f"Error saving snapshot {path.name}: {e}")
+            return
+        log.debug(f"Saved snapshot {path.name}: {len(result.raw)} bytes {result.encoding}")
+
+    def load(self, group_id: int, week: int) -> tuple[float, schedule_client.FetchResult] | None:
+        path = self._file(group_id, week)
+        try:
+            with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                magic, version, stored_group, start, fetched_at, meta_len = HEADER.unpack_from(mm)
+                if magic != MAGIC or version != FORMAT_VERSION or stored_group != group_id:
+                    log.warning(f"Skip snapshot {path.name}: unexpected header {magic} v{version}")
+                    return None
+                meta = json.loads(mm[HEADER.size:HEADER.size + meta_len])
+                view = memoryview(mm)[HEADER.size + meta_len:]
+                try:
+                    if schedule_client.body_digest(view, meta['encoding']) != meta['digest']:
+                        raise ValueError("digest mismatch")
+                    lessons = schedule_client.parse_payload(view, meta['encoding'])
+                    raw = bytes(view)
+                finally:
+                    view.release()
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            log.warning(f"Error reading snapshot {path.name}: {e}")
+            return None
+
+        result = schedule_client.FetchResult(group_id, start, lessons, digest=meta['digest'], raw=raw,
+                                             encoding=meta['encoding'], etag=meta['etag'],
+                                             last_modified=meta['last_modified'])
+        return fetched_at, result
+
+    def prune(self, before_week: int) -> None:
+        for path in self.path.glob("*.snap"):
+            try:
+                week = int(path.stem.split("-", 1)[1])
+            except (IndexError, ValueError):
+                continue
+            if week < before_week:
+                path.unlink(missing_ok=True)
@@ -0,0 +1,100 @@
+from datetime import datetime
+from html import escape
+
+from src.api.schadule_client import Lesson
+from src.app.db.changes import ChangeSet
+from src.app.db.rows import LessonRow, ScheduleDay
+from src.app.image.app import minutes_to_time
+import src.lib.date_utils as dutils
+
+
+def _lesson_line(lesson: LessonRow) -> str:
+    line = (f"<b>{minutes_to_time(lesson.start)}–{minutes_to_time(lesson.end)}</b> "
+            f"{escape(lesson.lesson_name or 'Без названия')}")
+    if lesson.classroom:
+        line += f"\n      🚪 {escape(lesson.classroom)}"
+    if lesson.flag_combine:
+        line += " · объединенная группа"
+    return line
+
+
+def format_day(date_str: str, lessons: list[LessonRow]) -> str:
+    title = f"📅 <b>{dutils.day_title(date_str)}</b>"
+    if not lessons:
+        return f"{title}\n\nЗанятий нет 🎉"
+    return title + "\n\n" + "\n".join(_lesson_line(lesson) for lesson in lessons)
+
+
+def format_next(lesson: LessonRow | None, now: datetime) -> str:
+    if lesson is None:
+        return "Ближайших занятий не найдено."
+
+    minutes_now = now.hour * 60 + now.minute
+    if lesson.date == now.strftime('%Y-%m-%d'):
+        if lesson.start <= minutes_now:
+            head = f"🔔 Сейчас идет (до {minutes_to_time(lesson.end)})"
+        else:
+            left = lesson.start - minutes_now
+            head = f"⏭ Следующее занятие через {left // 60} ч {left % 60} мин"
+    else:
+        head = f"⏭ Следующее занятие: {dutils.day_title(lesson.date)}"
+    return f"{head}\n\n{_lesson_line(lesson)}"
+
+
+def find_next(lessons: list[LessonRow], now: datetime) -> LessonRow | None:
+    today = now.strftime('%Y-%m-%d')
+    minutes_now = now.hour * 60 + now.minute
+    for lesson in lessons:
+        if lesson.date > today or (lesson.date == today and lesson.end > minutes_now):
+            return lesson
+    return None
+
+
+def format_stale(since: datetime | None) -> str:
+    if since is None:
+        return ""
+    return f"⚠️ Сервер расписания недоступен, данные от {since.strftime('%d.%m %H:%M')}"
+
+
+def format_week_html(schedule_days: list[ScheduleDay]) -> str:
+    if not schedule_days:
+        return "На эту неделю расписание не найдено."
+
+    blocks = []
+    for day in schedule_days:
+        rows = [f"{minutes_to_time(lesson.start)} {escape((lesson.classroom or '')[:12].ljust(12))} "
+                f"{escape((lesson.lesson_name or '')[:40])}"
+                for lesson in day.lessons]
+        blocks.append(f"<b>{day.title}</b>\n<pre>" + "\n".join(rows) + "</pre>")
+    return "\n".join(blocks)
+
+
+def _change_line(lesson: Lesson) -> str:
+    return (f"{minutes_to_time(lesson.start)} {escape(lesson.subject_title)}"
+            f"{', ауд. ' + escape(lesson.classroom_title) if lesson.classroom_title else ''}")
+
+
+def format_changes(group_id: int, changes: ChangeSet, limit: int = 20) -> str:
+    by_day: dict[str, list[str]] = {}
+    for lesson in changes.added:
+        by_day.setdefault(lesson.date, []).append(f"➕ {_change_line(lesson)}")
+    for lesson in changes.removed:
+        by_day.setdefault(lesson.date, []).append(f"➖ <s>{_change_line(lesson)}</s>")
+    for old, new in changes.moved:
+        by_day.setdefault(new.date, []).append(
+            f"🔁 {escape(new.subject_title)}: {minutes_to_time(old.start)} {escape(old.classroom_title or '')}"
+            f" → {minutes_to_time(new.start)} {escape(new.classroom_title or '')}")
+
+    lines = [f"🔔 <b>Изменения в расписании группы {group_id}</b>"]
+    shown = 0
+    for date_str in sorted(by_day):
+        if shown >= limit:
+            break
+        lines.append(f"\n<b>{dutils.day_title(date_str)}</b>")
+        day_lines = by_day[date_str][:limit - shown]
+        lines.extend(day_lines)
+        shown += len(day_lines)
+    total = sum(len(day) for day in by_day.values())
+    if total > shown:
+        lines.append(f"\n…и еще {total - shown}. Полное расписание: /schedule")
+    return "\n".join(lines)
@@ -29,6 +29,10 @@ class Config:
                 self.app = config_data.get("app", {})
                 self.storage = config_data.get("storage", {})
                 self.log = config_data.get("logger", {})
+                self.render = config_data.get("render", {})
+                self.api = config_data.get("api", {})
+                self.bot = config_data.get("bot", {})
+                self.ai = config_data.get("ai", {})
         except FileNotFoundError as e:
             print(f"File {e} not found")
             sys.exit(1)
@@ -50,6 +54,166 @@ class Config:
     def schedule_update(self) -> int:
         return self.app.get("schedule_update")
 
+    @property
+    def schedule_jitter(self) -> int:
+        return self.app.get("schedule_jitter", 30)
+
+    @property
+    def default_group(self) -> int:
+        return self.app.get("default_group", 43)
+
+    @property
+    def fetch_concurrency(self) -> int:
+        return self.app.get("fetch_concurrency", 4)
+
+    @property
+    def api_retries(self) -> int:
+        return self.api.get("retries", 3)
+
+    @property
+    def api_backoff_base(self) -> float:
+        return self.api.get("backoff_base", 0.5)
+
+    @property
+    def api_backoff_max(self) -> float:
+        return self.api.get("backoff_max", 5)
+
+    @property
+    def api_deadline(self) -> float:
+        return self.api.get("deadline", 30)
+
+    @property
+    def api_breaker_threshold(self) -> int:
+        return self.api.get("breaker_threshold", 5)
+
+    @property
+    def api_breaker_reset(self) -> float:
+        return self.api.get("breaker_reset", 60)
+
+    @property
+    def group_idle_days(self) -> int:
+        return self.app.get("group_idle_days", 30)
+
+    @property
+    def prefetch_ahead(self) -> int:
+        return self.app.get("prefetch_ahead", 1)
+
+    @property
+    def prefetch_behind(self) -> int:
+        return self.app.get("prefetch_behind", 1)
+
+    @property
+    def retention_weeks(self) -> int:
+        return self.app.get("retention_weeks", 8)
+
+    @property
+    def compact_interval_hours(self) -> int:
+        return self.app.get("compact_interval_hours", 24)
+
+    @property
+    def bot_concurrency(self) -> int:
+        return self.bot.get("concurrency", 8)
+
+    @property
+    def bot_queue_size(self) -> int:
+        return self.bot.get("queue_size", 256)
+
+    @property
+    def bot_poll_timeout(self) -> int:
+        return self.bot.get("poll_timeout", 25)
+
+    @property
+    def bot_shutdown_timeout(self) -> float:
+        return self.bot.get("shutdown_timeout", 10)
+
+    @property
+    def outbox_global_rate(self) -> float:
+        return self.bot.get("global_rate", 30)
+
+    @property
+    def outbox_chat_rate(self) -> float:
+        return self.bot.get("chat_rate", 1)
+
+    @property
+    def outbox_chat_burst(self) -> float:
+        return self.bot.get("chat_burst", 3)
+
+    @property
+    def outbox_group_per_minute(self) -> float:
+        return self.bot.get("group_per_minute", 20)
+
+    @property
+    def outbox_workers(self) -> int:
+        return self.bot.get("outbox_workers", 8)
+
+    @property
+    def bot_mode(self) -> str:
+        return self.bot.get("mode", "polling")
+
+    @property
+    def webhook_host(self) -> str:
+        return self.bot.get("webhook_host", "127.0.0.1")
+
+    @property
+    def webhook_port(self) -> int:
+        return self.bot.get("webhook_port", 8080)
+
+    @property
+    def webhook_path(self) -> str:
+        return self.bot.get("webhook_path", "/telegram")
+
+    @property
+    def webhook_url(self) -> str | None:
+        return self.bot.get("webhook_url")
+
+    @property
+    def webhook_secret(self) -> str:
+        return self.bot.get("webhook_secret") or os.environ.get("UNIBOT_WEBHOOK_SECRET", "")
+
+    @property
+    def webhook_reuse_port(self) -> bool:
+        return self.bot.get("webhook_reuse_port", True)
+
+    @property
+    def ai_workers(self) -> int:
+        return self.ai.get("workers", 1)
+
+    @property
+    def ai_queue_size(self) -> int:
+        return self.ai.get("queue_size", 50)
+
+    @property
+    def ai_max_pending_per_user(self) -> int:
+        return self.ai.get("max_pending_per_user", 2)
+
+    @property
+    def ai_per_user_per_hour(self) -> int:
+        return self.ai.get("per_user_per_hour", 30)
+
+    @property
+    def ai_deadline(self) -> float:
+        return self.ai.get("deadline", 120)
+
+    @property
+    def ai_model(self) -> str:
+        return self.ai.get("model", "deepseek-coder:6.7b")
+
+    @property
+    def api_host(self) -> str:
+        return self.api.get("host", "api.platform.nke.team:8443")
+
+    @property
+    def api_token(self) -> str:
+        return self.api.get("token", "nke")
+
+    @property
+    def api_connect_timeout(self) -> float:
+        return self.api.get("connect_timeout", 5)
+
+    @property
+    def api_read_timeout(self) -> float:
+        return self.api.get("read_timeout", 15)
+
     @property
     def root_dir(self) -> Path:
         root_str = self.app.get("root", "")
@@ -65,6 +229,58 @@ class Config:
     def db_name(self) -> str:
         return self.storage.get("name")
 
+    @property
+    def db_cache_size_kb(self) -> int:
+        return self.storage.get("cache_size_kb", 8192)
+
+    @property
+    def db_mmap_size(self) -> int:
+        return self.storage.get("mmap_size", 64 * 1024 * 1024)
+
+    @property
+    def snapshot_path(self) -> Path | None:
+        if not self.storage.get("snapshots", True):
+            return None
+        return self.storage_path / self.storage.get("snapshot_path", "snapshots")
+
+    @property
+    def render_cache_size(self) -> int:
+        return self.render.get("cache_size", 32)
+
+    @property
+    def render_cache_path(self) -> Path | None:
+        if not self.render.get("disk_cache", True):
+            return None
+        return self.storage_path / self.render.get("disk_path", "renders")
+
+    @property
+    def render_tile_cache_size(self) -> int:
+        return self.render.get("tile_cache_size", 48)
+
+    @property
+    def render_encoder(self) -> str:
+        return self.render.get("encoder", "png_palette")
+
+    @property
+    def render_workers(self) -> int:
+        return self.render.get("workers", 2)
+
+    @property
+    def render_queue_size(self) -> int:
+        return self.render.get("queue_size", 8)
+
+    @property
+    def render_queue_timeout(self) -> float:
+        return self.render.get("queue_timeout", 5)
+
+    @property
+    def render_font_dirs(self) -> list[str]:
+        return self.render.get("font_dirs", ["/usr/share/fonts/TTF", "/usr/share/fonts/truetype/dejavu"])
+
+    @property
+    def render_fonts(self) -> dict[str, str]:
+        return self.render.get("fonts", {})
+
     @property
     def log_path(self) -> Path:
         log_path_str = self.log.get("path", "./src/logger")
@@ -0,0 +1,66 @@
+from datetime import date, datetime, timedelta
+
+EPOCH = date(1970, 1, 1)
+
+
+def epoch_day(value: str | date | datetime) -> int:
+    if isinstance(value, str):
+        value = date.fromisoformat(value[:10])
+    elif isinstance(value, datetime):
+        value = value.date()
+    return (value - EPOCH).days
+
+
+def day_to_date(day: int) -> date:
+    return EPOCH + timedelta(days=day)
+
+
+def day_to_iso(day: int) -> str:
+    return day_to_date(day).isoformat()
+
+
+def week_of_day(day: int) -> int:
+    # 01.01.1970 - четверг, неделя начинается с понедельника
+    return day - (day + 3) % 7
+
+
+def day_of_timestamp(ts: int | float) -> int:
+    return epoch_day(datetime.fromtimestamp(ts))
+
+
+def week_of_timestamp(ts: int | float) -> int:
+    return week_of_day(day_of_timestamp(ts))
+
+
+WEEKDAYS = ('Понедельник', 'Вторник', 'Среда', 'Четверг', 'Пятница', 'Суббота', 'Воскресенье')
+
+
+def day_title(value: str | date | datetime) -> str:
+    if isinstance(value, str):
+        value = date.fromisoformat(value[:10])
+    return f"{value.strftime('%d.%m.%Y')} ({WEEKDAYS[value.weekday()]})"
+
+
+def week_timestamp(week: int) -> int:
+    # Полдень среды - внутри той же недели и в локальном времени, и в UTC
+    wednesday = day_to_date(week + 2)
+    return int(datetime(wednesday.year, wednesday.month, wednesday.day, 12).timestamp())
+
+
+def week_dates(week: int) -> list[str]:
+    return [day_to_iso(week + i) for i in range(7)]
+
+
+class DateFormatter:
+    @staticmethod
+    def start_week(ts: int | float) -> date:
+        return day_to_date(week_of_timestamp(ts))
+
+    @staticmethod
+    def end_week(ts: int | float) -> date:
+        return day_to_date(week_of_timestamp(ts) + 6)
+
+    @staticmethod
+    def week_dates(ts: int | float) -> list[str]:
+        return week_dates(week_of_timestamp(ts))
+
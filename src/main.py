@@ -1,7 +1,7 @@
 from src.app.app import App
 
 def main():
-    App()
+    App().run()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,98 @@
+import gzip
+import json
+import unittest
+import zlib
+
+from src.api.schadule_client import ItemStream, ScheduleApiError, iter_decoded, iter_items, parse_payload
+
+
+def item(sort: int, **extra) -> dict:
+    return {
+        'date': 1760918400,
+        'sort': sort,
+        'classroomId': 1,
+        'subgroup': None,
+        'start': 500 + sort * 100,
+        'end': 595 + sort * 100,
+        'teacher': {'full': 'Иванов И. И.', 'birthDate': None},
+        'classroom': {'title': None},
+        'plan': {'subject': {'title': f'Предмет {sort}', 'short': None}},
+        **extra,
+    }
+
+
+def split(data, size: int) -> list:
+    return [data[i:i + size] for i in range(0, len(data), size)]
+
+
+class ItemStreamTest(unittest.TestCase):
+    def items(self, document: str, size: int) -> list[dict]:
+        return list(iter_items(split(document.encode('utf-8'), size)))
+
+    def test_any_chunk_size(self):
+        document = json.dumps({'total': 3, 'items': [item(1), item(2), item(3)]}, ensure_ascii=False)
+        for size in (1, 2, 7, 64, len(document)):
+            self.assertEqual([i['sort'] for i in self.items(document, size)], [1, 2, 3])
+
+    def test_nested_items_key_before_top_level(self):
+        document = json.dumps({
+            'meta': {'items': {'count': 1}, 'note': 'see "items": [] below'},
+            'paging': {'items': [{'sort': 99}]},
+            'items': [item(1, extra={'items': [0]}), item(2)],
+        })
+        for size in (1, 5, len(document)):
+            self.assertEqual([i['sort'] for i in self.items(document, size)], [1, 2])
+
+    def test_items_value_with_escaped_quotes(self):
+        document = '{"title": "a \\"items\\": [", "items": [' + json.dumps(item(4)) + ']}'
+        self.assertEqual([i['sort'] for i in self.items(document, 3)], [4])
+
+    def test_fallback_to_json_loads(self):
+        # Экранированный ключ сканер не узнает, его разбирает json.loads
+        document = '{"it\\u0065ms": [' + json.dumps(item(5)) + ']}'
+        self.assertEqual([i['sort'] for i in self.items(document, 4)], [5])
+
+    def test_no_items_array(self):
+        with self.assertRaises(ScheduleApiError):
+            self.items('{"items": null}', 4)
+        with self.assertRaises(ScheduleApiError):
+            self.items('[1, 2]', 4)
+
+    def test_truncated_array(self):
+        document = json.dumps({'items': [item(1), item(2)]})
+        with self.assertRaises(ScheduleApiError):
+            self.items(document[:-10], 16)
+
+    def test_empty_items(self):
+        stream = ItemStream()
+        self.assertEqual(stream.feed('{"items": []}'), [])
+        self.assertEqual(stream.close(), [])
+
+
+class DecodeTest(unittest.TestCase):
+    payload = json.dumps({'items': [item(2), item(1)]}).encode('utf-8')
+
+    def test_encodings(self):
+        raw_deflate = zlib.compressobj(wbits=-zlib.MAX_WBITS)
+        bodies = {
+            'identity': self.payload,
+            'gzip': gzip.compress(self.payload),
+            'deflate': zlib.compress(self.payload),
+            'raw deflate': raw_deflate.compress(self.payload) + raw_deflate.flush(),
+        }
+        for name, body in bodies.items():
+            encoding = 'deflate' if name == 'raw deflate' else name
+            for size in (1, 2, 3, 1024):
+                with self.subTest(encoding=name, size=size):
+                    decoded = b"".join(iter_decoded(split(body, size), encoding))
+                    self.assertEqual(decoded, self.payload)
+
+    def test_parse_payload(self):
+        lessons = parse_payload(gzip.compress(self.payload), 'gzip')
+        self.assertEqual([lesson.sort for lesson in lessons], [1, 2])
+        self.assertIsNone(lessons[0].classroom_title)
+        self.assertIsNone(lessons[0].short_subject_title)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,84 @@
+import asyncio
+import socket
+import unittest
+
+import aiohttp
+
+from src.api.dispatcher import ChatDispatcher
+from src.api.webhook import SECRET_HEADER, WebhookServer
+
+SECRET = "test-secret"
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def update(update_id: int, chat_id: int) -> dict:
+    return {
+        'update_id': update_id,
+        'message': {
+            'message_id': update_id,
+            'date': 0,
+            'chat': {'id': chat_id, 'type': 'private'},
+            'from': {'id': chat_id, 'is_bot': False, 'first_name': 'test'},
+            'text': 'hi',
+        },
+    }
+
+
+class WebhookServerTest(unittest.IsolatedAsyncioTestCase):
+    # Фейковый клиент Telegram: шлет апдейты прямо в WebhookServer
+    async def asyncSetUp(self):
+        self.handled = []
+        self.release = asyncio.Event()
+        self.release.set()
+        self.dispatcher = ChatDispatcher(self.handle, concurrency=1, queue_size=1)
+        self.port = free_port()
+        self.server = await WebhookServer(self.dispatcher, SECRET, "/telegram", "127.0.0.1", self.port,
+                                          reuse_port=False).start()
+        self.session = aiohttp.ClientSession()
+
+    async def asyncTearDown(self):
+        self.release.set()
+        await self.session.close()
+        await self.server.stop()
+        await self.dispatcher.close(1)
+
+    async def handle(self, upd):
+        await self.release.wait()
+        self.handled.append(upd.update_id)
+
+    async def post(self, body: dict, secret: str = SECRET) -> int:
+        async with self.session.post(f"http://127.0.0.1:{self.port}/telegram", json=body,
+                                     headers={SECRET_HEADER: secret}) as res:
+            return res.status
+
+    async def test_wrong_secret(self):
+        self.assertEqual(await self.post(update(1, 1), secret="wrong"), 401)
+        await asyncio.sleep(0.05)
+        self.assertEqual(self.handled, [])
+
+    async def test_update_dispatched(self):
+        self.assertEqual(await self.post(update(2, 1)), 200)
+        await asyncio.sleep(0.05)
+        self.assertEqual(self.handled, [2])
+
+    async def test_bad_payload(self):
+        async with self.session.post(f"http://127.0.0.1:{self.port}/telegram", data=b"not json",
+                                     headers={SECRET_HEADER: SECRET}) as res:
+            self.assertEqual(res.status, 400)
+
+    async def test_queue_full(self):
+        self.release.clear()
+        self.assertEqual(await self.post(update(3, 1)), 200)
+        self.assertEqual(await self.post(update(4, 2)), 503)
+        self.release.set()
+        await asyncio.sleep(0.05)
+        self.assertEqual(self.handled, [3])
+
+
+if __name__ == '__main__':
+    unittest.main()